@@ -14,6 +14,8 @@
 
 """Argument parsing"""
 
+from cstar.runnerpool import DEFAULT_MAX_WORKERS
+
 
 def _add_common_arguments(parser):
     parser.add_argument('--stop-after', type=int, help='Stop the job after specified number of hosts')
@@ -85,12 +87,20 @@ def _add_strategy_arguments(parser):
                         help='Run on all nodes, on all data centers at once and for each cluster ')
 
 
+def _add_engine_arguments(parser):
+    parser.add_argument('--engine', choices=("threads", "asyncio"), default=None,
+                        help='Drive the job from one thread per host, or from a single asyncio event loop')
+    parser.add_argument('--max-workers', type=int, default=None,
+                        help='Maximum number of job runners active at the same time, independently of '
+                             '--max-concurrency (default %d). Further hosts wait until a worker is free.' % (DEFAULT_MAX_WORKERS,))
+
+
 def _add_cstar_arguments_without_command(parser):
     """Argument parsing for case when cstar is called without specifying a command to run"""
     parser.add_argument('--max-job-age', default=7, type=int, help='Maximum age in days of a job to resume')
 
 
-def add_cstar_arguments(parser, commands, execute_command, execute_continue, execute_cleanup):
+def add_cstar_arguments(parser, commands, execute_command, execute_continue, execute_cleanup, execute_list_jobs=None):
     """Argument parsing for case when cstar is called specifying a command to run"""
     subparsers = parser.add_subparsers(dest='sub_command')
 
@@ -100,6 +110,7 @@ def add_cstar_arguments(parser, commands, execute_command, execute_continue, exe
     continue_parser.add_argument('--retry-failed', action="store_true", default=False,
                         help='Retry failed nodes.')
     _add_common_arguments(continue_parser)
+    _add_engine_arguments(continue_parser)
     _add_cstar_arguments_without_command(continue_parser)
     _add_ssh_arguments(continue_parser)
     _add_jmx_auth_arguments(continue_parser)
@@ -111,6 +122,11 @@ def add_cstar_arguments(parser, commands, execute_command, execute_continue, exe
     _add_ssh_arguments(cleanup_parser)
     _add_jmx_auth_arguments(cleanup_parser)
 
+    if execute_list_jobs:
+        list_parser = subparsers.add_parser('list-jobs', help='List jobs and their status and exit (*)')
+        # Takes no options, but main() reads these from every sub command
+        list_parser.set_defaults(func=execute_list_jobs, verbose=0, jmx_username=None, jmx_passwordfile=None)
+
     for (name, command) in commands.items():
         command_parser = subparsers.add_parser(name, help=command.description)
         for arg in command.arguments:
@@ -118,6 +134,7 @@ def add_cstar_arguments(parser, commands, execute_command, execute_continue, exe
         _add_destination_arguments(command_parser)
         _add_strategy_arguments(command_parser)
         _add_common_arguments(command_parser)
+        _add_engine_arguments(command_parser)
         _add_ssh_arguments(command_parser)
         _add_jmx_auth_arguments(command_parser)
         command_parser.set_defaults(func=lambda args: execute_command(args), command=command)
@@ -128,6 +145,7 @@ def add_cstarpar_arguments(parser):
     _add_destination_arguments(parser)
     _add_common_arguments(parser)
     _add_strategy_arguments(parser)
+    _add_engine_arguments(parser)
     _add_ssh_arguments(parser)
     _add_jmx_auth_arguments(parser)
     parser.add_argument('command', help='Command to run once for each Cassandra host')
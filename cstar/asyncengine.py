@@ -0,0 +1,101 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run a job from a single asyncio event loop"""
+
+import asyncio
+import queue
+
+import cstar.job
+import cstar.runnerpool
+from cstar.output import debug
+
+
+class AsyncEngine(object):
+    """Drives scheduling, result collection and topology refreshes of a job from one event loop.
+
+    Job runners still use blocking SSH calls, so they are executed in a cstar.runnerpool.RunnerPool rather than in one
+    thread per host. The job schedules no more hosts than the pool has workers. Topology refreshes
+    use the event loop's default executor so that they never queue up behind long running jobs."""
+
+    def __init__(self, job, max_workers=cstar.runnerpool.DEFAULT_MAX_WORKERS):
+        self.job = job
+        self.max_workers = max_workers
+        self._pool = None
+        self._tasks = set()
+
+    def run(self, resume_hosts=()):
+        # Not asyncio.run(), which needs Python 3.7
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._run(list(resume_hosts)))
+        finally:
+            loop.close()
+
+    async def _run(self, resume_hosts):
+        job = self.job
+        self._pool = cstar.runnerpool.RunnerPool(self.max_workers, job.sleep_on_new_runner or 0)
+        try:
+            for host in resume_hosts:
+                debug("Resume on host", host.fqdn)
+                await self._start(host)
+
+            job.begin_run()
+            while job.do_loop:
+                for host in job.runnable_hosts():
+                    debug("Running on host", host.fqdn)
+                    await self._start(host)
+
+                if job.state.is_done():
+                    job.do_loop = False
+
+                if job.do_loop:
+                    finished = await self._wait_for_any_job(job.timeout)
+                    job.handle_finished_jobs(finished)
+                    await self._wait_for_node_to_return([host for host, _ in finished])
+
+            while job.state.progress.running:
+                job.handle_finished_jobs(await self._wait_for_any_job(None))
+        finally:
+            self._pool.shutdown()
+        job.end_run()
+
+    async def _start(self, host):
+        loop = asyncio.get_event_loop()
+        # The pool spaces out the start of runners, the loop goes on scheduling
+        self._tasks.add(loop.run_in_executor(self._pool.executor, self._pool.run, self.job.new_runner(host)))
+
+    async def _wait_for_any_job(self, timeout):
+        """Wait until at least one runner has reported its result, and return all reported results"""
+        results = self.job.results
+        while results.empty():
+            if not self._tasks:
+                raise queue.Empty()
+            done, self._tasks = await asyncio.wait(self._tasks, timeout=timeout,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise queue.Empty()
+            for task in done:
+                # Raise exceptions from runners here rather than losing them
+                task.result()
+
+        finished = []
+        while not results.empty():
+            finished.append(results.get_nowait())
+        return finished
+
+    async def _wait_for_node_to_return(self, nodes):
+        loop = asyncio.get_event_loop()
+        while not await loop.run_in_executor(None, self.job.check_nodes_returned, nodes):
+            await asyncio.sleep(cstar.job.NODE_RETURN_POLL_INTERVAL)
@@ -0,0 +1,143 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""On-disk cache of endpoint mappings"""
+
+import hashlib
+import json
+import os
+import time
+
+from cstar.output import debug, warn
+from cstar.topology import Host
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_MAX_ENTRIES = 64
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+
+_PREFIX = "endpoint-mapping-"
+_SUFFIX = ".json"
+# Endpoint mappings used to be cached as pickles under this prefix
+_LEGACY_PREFIX = "endpoint_mapping-"
+
+
+def cache_key(schema_versions, topology_hashes):
+    """A fixed length key for the clusters with the given schema versions and topology hashes"""
+    data = json.dumps([sorted(schema_versions), sorted(topology_hashes)])
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _to_dict(mapping):
+    # Number the hosts that are keys of the mapping first, then hosts that are only neighbours
+    ids = {}
+    hosts = []
+    for host in list(mapping) + [friend for friends in mapping.values() for friend in friends]:
+        if host not in ids:
+            ids[host] = len(hosts)
+            hosts.append(host)
+    return {"version": CACHE_FORMAT_VERSION,
+            "hosts": [list(host) for host in hosts],
+            "neighbours": [sorted(ids[friend] for friend in mapping[host]) for host in mapping]}
+
+
+def _from_dict(data, topology=None):
+    if data.get("version") != CACHE_FORMAT_VERSION:
+        raise ValueError("Unsupported endpoint mapping cache version %s" % (data.get("version"),))
+    hosts = [Host(*arr) for arr in data["hosts"]]
+    if topology is not None:
+        # Prefer the hosts of the topology, their state is more recent
+        by_ip = topology.hosts_by_ip
+        hosts = [by_ip.get(host.ip, host) for host in hosts]
+    return dict((host, set(hosts[i] for i in neighbours)) for host, neighbours in zip(hosts, data["neighbours"]))
+
+
+class EndpointMappingCache(object):
+    """Endpoint mappings stored as versioned JSON files in directory, with hosts numbered so that each host is
+    written once.
+
+    Files are written atomically. When a mapping is stored, files older than max_age seconds are deleted, and so are
+    the least recently used ones beyond max_entries. Unreadable files are deleted and treated as missing."""
+
+    def __init__(self, directory, max_entries=DEFAULT_MAX_ENTRIES, max_age=DEFAULT_MAX_AGE, clock=time.time):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._clock = clock
+
+    def _path(self, key):
+        return os.path.join(self.directory, _PREFIX + key + _SUFFIX)
+
+    def get(self, key, topology=None):
+        path = self._path(key)
+        if not os.path.exists(path):
+            debug("Cache miss for endpoint mapping")
+            return None
+        try:
+            with open(path) as f:
+                mapping = _from_dict(json.load(f), topology)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            warn("Deleting unreadable endpoint mapping cache %s:" % (path,), e)
+            self._remove(path)
+            return None
+        debug("Getting endpoint mapping from cache")
+        # Mark as recently used
+        now = self._clock()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        return mapping
+
+    def put(self, key, mapping):
+        path = self._path(key)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(_to_dict(mapping), f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+            now = self._clock()
+            os.utime(path, (now, now))
+        except OSError as e:
+            warn("Could not write endpoint mapping cache %s:" % (path,), e)
+            self._remove(tmp_path)
+        self.evict()
+
+    def evict(self):
+        now = self._clock()
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(_LEGACY_PREFIX):
+                self._remove(path)
+                continue
+            if not (name.startswith(_PREFIX) and name.endswith(_SUFFIX)):
+                continue
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if now - mtime > self.max_age:
+                self._remove(path)
+            else:
+                entries.append((mtime, path))
+        entries.sort(reverse=True)
+        for _, path in entries[self.max_entries:]:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
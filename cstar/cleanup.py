@@ -14,19 +14,52 @@
 
 import cstar.job
 import cstar.jobreader
+import cstar.jobwriter
 import cstar.exceptions
 import os
 import shutil
 
 from cstar.output import msg
 
+JOB_DIR = '~/.cstar/jobs'
 
-def cleanup(max_days, listdir=os.listdir, jobread=cstar.jobreader.read, delete=shutil.rmtree):
-    job_dir = os.path.expanduser('~/.cstar/jobs')
+
+def _is_resumable(metadata, max_days):
+    return (metadata["file_format_version"] in cstar.jobwriter.READABLE_FILE_FORMAT_VERSIONS and
+            cstar.jobreader.job_age(metadata["creation_timestamp"]) <= max_days)
+
+
+def cleanup(max_days, listdir=os.listdir, jobread=cstar.jobreader.read, delete=shutil.rmtree,
+            read_metadata=cstar.jobreader.read_metadata):
+    job_dir = os.path.expanduser(JOB_DIR)
     for job_id in listdir(job_dir):
+        full_name = os.path.join(job_dir, job_id)
         try:
-            jobread(cstar.job.Job(), job_id, stop_after=None, max_days=max_days, endpoint_mapper=lambda x: None)
+            keep = _is_resumable(read_metadata(full_name), max_days)
         except Exception:
+            # Jobs written by older versions of cstar have no metadata, see if the job file can still be read
+            try:
+                jobread(cstar.job.Job(), job_id, stop_after=None, max_days=max_days, endpoint_mapper=lambda x: None)
+                keep = True
+            except Exception:
+                keep = False
+        if not keep:
             msg("Removing job", job_id)
-            full_name = os.path.join(job_dir, job_id)
             delete(full_name)
+
+
+def list_jobs(listdir=os.listdir, read_metadata=cstar.jobreader.read_metadata):
+    """Return (job id, metadata) for every job, oldest first. Jobs without readable metadata come last, with None."""
+    job_dir = os.path.expanduser(JOB_DIR)
+    jobs = []
+    try:
+        job_ids = listdir(job_dir)
+    except FileNotFoundError:
+        return jobs
+    for job_id in job_ids:
+        try:
+            metadata = read_metadata(os.path.join(job_dir, job_id))
+        except Exception:
+            metadata = None
+        jobs.append((job_id, metadata))
+    return sorted(jobs, key=lambda job: (job[1] is None, job[1]["creation_timestamp"] if job[1] else 0, job[0]))
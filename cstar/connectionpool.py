@@ -0,0 +1,138 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A pool of SSH connections shared by everything that talks to a host during a job"""
+
+import collections
+import contextlib
+import threading
+import time
+
+from cstar.exceptions import BadSSHHost
+from cstar.output import debug
+
+DEFAULT_MAX_SIZE = 256
+DEFAULT_IDLE_TIMEOUT = 300
+
+
+class _Entry(object):
+    def __init__(self, conn, now):
+        self.conn = conn
+        self.leases = 0
+        self.last_used = now
+        # Taken out of the pool after a failure, closed when the last lease is released
+        self.failed = False
+
+
+class ConnectionPool(object):
+    """Keeps one connection per host open between uses.
+
+    Connections are created with the connect function the first time a host is leased. Connections that have not
+    been leased for idle_timeout seconds are closed, and when more than max_size connections are open the least
+    recently used idle ones are closed. Connections that are leased are never closed by the pool, so the pool can
+    temporarily hold more than max_size connections.
+
+    A lease that fails with BadSSHHost takes the connection of that host out of the pool, so that the next lease
+    reconnects. Other threads may still be using the connection, it is closed once their leases are released."""
+
+    def __init__(self, connect, max_size=DEFAULT_MAX_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT, clock=time.monotonic):
+        self._connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._failed = set()
+        self._failures = {}
+
+    @contextlib.contextmanager
+    def lease(self, host):
+        entry = self._acquire(host)
+        try:
+            yield entry.conn
+        except BadSSHHost:
+            self._mark_failed(host, entry)
+            raise
+        finally:
+            self._release(entry)
+
+    def _acquire(self, host):
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is None:
+                entry = _Entry(self._connect(host), self._clock())
+                self._entries[host] = entry
+            self._entries.move_to_end(host)
+            entry.leases += 1
+            entry.last_used = self._clock()
+            evicted = self._evict()
+        self._close_all(evicted)
+        return entry
+
+    def _release(self, entry):
+        with self._lock:
+            entry.leases -= 1
+            entry.last_used = self._clock()
+            evicted = self._evict()
+            if entry.failed and not entry.leases:
+                self._failed.discard(entry)
+                evicted.append(entry.conn)
+        self._close_all(evicted)
+
+    def _mark_failed(self, host, entry):
+        """Record a failure for host and take its connection out of the pool so that the next lease reconnects"""
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if entry.failed:
+                return
+            entry.failed = True
+            if self._entries.get(host) is entry:
+                del self._entries[host]
+            self._failed.add(entry)
+            failures = self._failures[host]
+        debug("Dropping connection to", host, "after", failures, "failures")
+
+    def failures(self, host):
+        """Return the number of failed leases of host since the pool was created"""
+        with self._lock:
+            return self._failures.get(host, 0)
+
+    def _evict(self):
+        """Remove idle and surplus connections from the pool. Must be called with the lock held. Returns the
+        connections to close."""
+        now = self._clock()
+        evicted = []
+        for host, entry in list(self._entries.items()):
+            if entry.leases:
+                continue
+            if (now - entry.last_used) > self.idle_timeout or (len(self._entries) > self.max_size):
+                del self._entries[host]
+                evicted.append(entry.conn)
+        return evicted
+
+    @staticmethod
+    def _close_all(conns):
+        for conn in conns:
+            if conn:
+                conn.close()
+
+    def close(self):
+        with self._lock:
+            conns = [entry.conn for entry in list(self._entries.values()) + list(self._failed)]
+            self._entries.clear()
+            self._failed.clear()
+        self._close_all(conns)
+
+    def __len__(self):
+        return len(self._entries)
@@ -16,6 +16,7 @@
 
 import argparse
 import copy
+import datetime
 import getpass
 import json
 import sys
@@ -28,6 +29,7 @@ import cstar.job
 import cstar.jobreader
 import cstar.jobrunner
 import cstar.output
+import cstar.runnerpool
 import cstar.signalhandler
 import cstar.strategy
 from cstar.exceptions import BadArgument
@@ -63,6 +65,11 @@ def execute_continue(args):
         if job.jmx_username and not job.jmx_passwordfile:
             job.jmx_password = getpass.getpass(prompt="JMX Password ")
 
+        if args.engine:
+            job.engine = args.engine
+        if args.max_workers:
+            job.max_workers = args.max_workers
+
         msg("Running ", job.command)
 
         cstar.signalhandler.print_message_and_save_on_sigint(job, job.job_id)
@@ -75,6 +82,21 @@ def execute_cleanup(args):
     cstar.cleanup.cleanup(args.max_job_age)
 
 
+def execute_list_jobs(args):
+    jobs = cstar.cleanup.list_jobs()
+    if not jobs:
+        msg("No jobs")
+        return
+    msg("%-36s  %-19s  %-10s  %-23s  %s" % ("JOB ID", "CREATED (UTC)", "STATUS", "DONE/FAILED/RUNNING/ALL", "COMMAND"))
+    for job_id, metadata in jobs:
+        if not metadata:
+            msg("%-36s  %-19s  %-10s" % (job_id, "?", "unknown"))
+            continue
+        created = datetime.datetime.utcfromtimestamp(metadata["creation_timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
+        hosts = "%d/%d/%d/%d" % (metadata["done"], metadata["failed"], metadata["running"], metadata["hosts"])
+        msg("%-36s  %-19s  %-10s  %-23s  %s" % (job_id, created, metadata["status"], hosts, metadata["command"]))
+
+
 def execute_command(args):
     cstar.output.debug(args)
     command = args.command
@@ -144,7 +166,9 @@ def execute_command(args):
             jmx_passwordfile=args.jmx_passwordfile,
             addl_jmx_args=args.jmx_addlargs,
             resolve_hostnames=args.resolve_hostnames,
-            hosts_variables=hosts_variables)
+            hosts_variables=hosts_variables,
+            engine=fallback(args.engine, cstar.job.THREADS_ENGINE),
+            max_workers=fallback(args.max_workers, cstar.runnerpool.DEFAULT_MAX_WORKERS))
         job.run()
 
 def validate_uuid4(uuid_string):
@@ -211,7 +235,8 @@ def args_from_strategy_shortcut(args):
 def main():
     parser = argparse.ArgumentParser(
         description='cstar', prog='cstar', formatter_class=argparse.RawDescriptionHelpFormatter, epilog="(*): Special built-in cstar job management action")
-    cstar.args.add_cstar_arguments(parser, get_commands(), execute_command, execute_continue, execute_cleanup)
+    cstar.args.add_cstar_arguments(parser, get_commands(), execute_command, execute_continue, execute_cleanup,
+                                    execute_list_jobs)
 
     #no input
     if len(sys.argv) <= 1:
@@ -25,6 +25,7 @@ import cstar.command
 import cstar.strategy
 import cstar.job
 import cstar.remote
+import cstar.runnerpool
 from cstar.output import msg, error, emph
 import cstar.output
 import cstar.signalhandler
@@ -111,7 +112,9 @@ def main():
             jmx_password=namespace.jmx_password,
             jmx_passwordfile=namespace.jmx_passwordfile,
             resolve_hostnames=namespace.resolve_hostnames,
-            hosts_variables=hosts_variables)
+            hosts_variables=hosts_variables,
+            engine=fallback(namespace.engine, cstar.job.THREADS_ENGINE),
+            max_workers=fallback(namespace.max_workers, cstar.runnerpool.DEFAULT_MAX_WORKERS))
         job.run()
 
 
@@ -20,7 +20,22 @@ import collections
 
 
 def parse(range_mapping, topology, lookup=socket.gethostbyname):
-    return _topology_map(_dns_map(_parse_range_mapping(range_mapping), lookup), topology)
+    return parse_endpoints((range.get("endpoints") for range in range_mapping), topology, lookup)
+
+
+def parse_endpoints(endpoints, topology, lookup=socket.gethostbyname):
+    """Like parse, but takes an iterable of endpoint tuples, one per token range"""
+    addresses, neighbours = _adjacency(endpoints)
+    # Resolve every distinct address once
+    hosts = [topology.get_host(lookup(address)) for address in addresses]
+    res = {}
+    # Fallback for case with no overlap
+    for host in topology:
+        res[host] = set()
+    for host, host_neighbours in zip(hosts, neighbours):
+        res[host] |= set(hosts[i] for i in host_neighbours
+                         if hosts[i].cluster == host.cluster and hosts[i].dc == host.dc)
+    return res
 
 
 def merge(mappings):
@@ -31,31 +46,16 @@ def merge(mappings):
     return res
 
 
-def _parse_range_mapping(ranges):
-    mapping = {}
-    for range in ranges:
-        for host1 in range.get("endpoints"):
-            for host2 in range.get("endpoints"):
-                if host1 != host2:
-                    mapping.setdefault(host1, set()).add(host2)
-    return mapping
-
-
-def _dns_map(mapping, lookup=socket.gethostbyname):
-    return dict(
-        (lookup(raw_host), set(lookup(raw_friend) for raw_friend in raw_friends))
-        for raw_host, raw_friends in mapping.items())
-
-
-def _topology_map(mapping, topology):
-    res = {}
-    # Fallback for case with no overlap
-    for host in topology:
-        res[host] = set()
-    for raw_host, raw_friends in mapping.items():
-        friends = (topology.get_host(raw_friend) for raw_friend in raw_friends)
-        host = topology.get_host(raw_host)
-        filtered_friends = set(friend for friend in friends
-                               if friend.cluster == host.cluster and friend.dc == host.dc)
-        res[host] = filtered_friends
-    return res
+def _adjacency(endpoints):
+    """Number the distinct addresses in endpoints, and return them with the set of neighbour numbers of each"""
+    # With vnodes, many token ranges have the same replicas. Only handle each replica set once.
+    replica_sets = set(frozenset(replicas) for replicas in endpoints)
+    ids = {}
+    id_sets = [[ids.setdefault(address, len(ids)) for address in replicas] for replicas in replica_sets]
+    neighbours = [set() for _ in ids]
+    for members in id_sets:
+        for i in members:
+            neighbours[i].update(members)
+    for i, host_neighbours in enumerate(neighbours):
+        host_neighbours.discard(i)
+    return list(ids), neighbours
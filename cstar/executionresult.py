@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 from collections import namedtuple
 import cstar.exceptions
 
@@ -23,3 +24,35 @@ class ExecutionResult(namedtuple("ExecutionResult", "command status out err")):
             raise cstar.exceptions.FailedExecution('Command "%s" failed with status %d and error message %s' %
                                                    (self.command, self.status, self.err))
         return self.out
+
+
+class OutputTail(object):
+    """Collects chunks of output, but only keeps the last limit bytes of it in memory"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.size = 0
+        self.truncated = False
+        self._chunks = collections.deque()
+
+    def append(self, chunk):
+        if not chunk:
+            return
+        self._chunks.append(chunk)
+        self.size += len(chunk)
+        while self.size > self.limit:
+            excess = self.size - self.limit
+            first = self._chunks[0]
+            if len(first) <= excess:
+                self._chunks.popleft()
+                self.size -= len(first)
+            else:
+                self._chunks[0] = first[excess:]
+                self.size -= excess
+            self.truncated = True
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def getvalue(self):
+        return b''.join(self._chunks)
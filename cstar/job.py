@@ -12,17 +12,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import concurrent.futures
 import json
 import queue
 import time
-import socket
 import os
 import threading
-import functools
-import pickle
-import sys
+import uuid
 
+import cstar.asyncengine
+import cstar.cache
 import cstar.remote
+import cstar.resolver
+import cstar.runnerpool
+import cstar.connectionpool
 import cstar.endpoint_mapping
 import cstar.topology
 from cstar.topology import Topology
@@ -34,14 +38,34 @@ import cstar.jobprinter
 import cstar.jobwriter
 from cstar.exceptions import BadSSHHost, NoHostsSpecified, HostIsDown, \
     NoDefaultKeyspace, UnknownHost, FailedExecution
-from cstar.output import msg, debug, emph, info, error, warn
+from cstar.output import msg, debug, emph, info, err, error, warn
 
 MAX_ATTEMPTS = 3
-
-
-@functools.lru_cache(None)
-def ip_lookup(name):
-    return socket.gethostbyname(name)
+# Number of hosts asked concurrently for the topology of their cluster. Hosts still being asked once their cluster
+# is known are not waited for, but keep running nodetool, so this is kept small.
+DISCOVERY_WORKERS = 3
+# Number of threads deleting remote job directories once their results have been saved
+CLEANUP_WORKERS = 8
+# Number of seconds between topology refreshes while waiting for nodes to come back up
+NODE_RETURN_POLL_INTERVAL = 5
+
+THREADS_ENGINE = "threads"
+ASYNCIO_ENGINE = "asyncio"
+
+
+def one_keyspace_per_replication(keyspaces, replication):
+    """Return the first of keyspaces for each distinct replication signature, and all keyspaces whose replication
+    is unknown"""
+    seen = set()
+    distinct = []
+    for keyspace in keyspaces:
+        signature = replication.get(keyspace)
+        if signature is not None:
+            if signature in seen:
+                continue
+            seen.add(signature)
+        distinct.append(keyspace)
+    return distinct
 
 
 class Job(object):
@@ -52,9 +76,15 @@ class Job(object):
     """
 
     def __init__(self):
-        self._connections = {}
+        self._pool = cstar.connectionpool.ConnectionPool(self._new_connection)
         self.results = queue.Queue()
-        self.handled_finished_jobs = set()
+        self._handled_callbacks = {}
+        self._handled_lock = threading.Lock()
+        self._resolver = None
+        self._resolver_lock = threading.Lock()
+        self._writer = None
+        self.cache_directory = None
+        self._cleanup_executor = concurrent.futures.ThreadPoolExecutor(max_workers=CLEANUP_WORKERS)
         self.state = None
         self.command = None
         self.job_id = None
@@ -65,9 +95,10 @@ class Job(object):
         self.job_runner = None
         self.key_space = None
         self.output_directory = None
-        self.is_preheated = False
         self.sleep_on_new_runner = None
         self.sleep_after_done = None
+        self.max_workers = cstar.runnerpool.DEFAULT_MAX_WORKERS
+        self._runner_pool = None
         self.ssh_username = None
         self.ssh_password = None
         self.ssh_identity_file = None
@@ -81,8 +112,10 @@ class Job(object):
         self.returned_jobs = list()
         self.schema_versions = list()
         self.status_topology_hash = list()
+        self._cluster_versions = {}
+        self._keyspace_replication = {}
         self.resolve_hostnames = False
-
+        self.engine = THREADS_ENGINE
 
     def __enter__(self):
         return self
@@ -97,79 +130,123 @@ class Job(object):
                 error(exc_value)
 
 
-    def get_cluster_topology(self, seed_nodes):
-        cluster_names = list()
-        self.schema_versions = list()
-        self.status_topology_hash = list()
-        topologies = list()
-        count = 0
-        tried_hosts = []
-        for host in seed_nodes:
-            tried_hosts.append(host)
-            conn = self._connection(host)
-
-            describe_res = self.run_nodetool(conn, "describecluster")
-            status_res = self.run_nodetool(conn, "status")
-            if (describe_res.status == 0) and (status_res.status == 0):
-                (cluster_name, schema_version) = cstar.nodetoolparser.parse_describe_cluster(describe_res.out)
-                if cluster_name not in cluster_names:
-                    cluster_names.append(cluster_name)
-                    topologies.append(cstar.nodetoolparser.parse_nodetool_status(status_res.out, cluster_name, self.reverse_dns_preheat, self.resolve_hostnames))
-                    self.schema_versions.append(schema_version)
-                    self.status_topology_hash.append(topologies[len(topologies) - 1].get_hash())
+    def get_cluster_topology(self, seed_nodes, cluster=None):
+        """Fetch the topology of the clusters that up to MAX_ATTEMPTS of the seed nodes belong to.
 
-
-            count += 1
-            if count >= MAX_ATTEMPTS:
-                break
-        if len(topologies) > 0:
-            final_topology = set()
-            for i in range(len(topologies)):
-                final_topology.update(topologies[i].hosts)
-            return Topology(final_topology)
-        raise HostIsDown("Could not find any working host while fetching topology. Is Cassandra actually running? Tried the following hosts:",
-                         ", ".join([x.ip for x in tried_hosts]))
-
-    def get_cache_file_path(self, cache_type):
-        debug("Cache file: {}-{}-{}".format(cache_type, "-".join(sorted(self.schema_versions)), "-".join(sorted(self.status_topology_hash))))
-        return os.path.join(self.cache_directory, "{}-{}-{}".format(cache_type, "-".join(sorted(self.schema_versions)), "-".join(sorted(self.status_topology_hash))))
-
-    def maybe_get_data_from_cache(self, cache_type):
+        The seeds are asked concurrently. If all seeds are known to belong to cluster, the first answer is used and
+        the remaining seeds are not waited for."""
+        tried_hosts = list(seed_nodes)[:MAX_ATTEMPTS]
+        if cluster is None:
+            found, failures = self._discover_clusters(tried_hosts, lambda host, found: False)
+        else:
+            found, failures = self._discover_clusters(tried_hosts, lambda host, found: cluster in found)
+
+        if not found:
+            for host, e in failures:
+                if e:
+                    raise e
+            raise HostIsDown("Could not find any working host while fetching topology. Is Cassandra actually running? Tried the following hosts:",
+                             ", ".join([getattr(x, "ip", x) for x in tried_hosts]))
+        return self._add_clusters(found)
+
+    def get_hosts_topology(self, ips):
+        """Fetch the topology of every cluster that one of ips belongs to, all clusters concurrently"""
+        def covered(ip, found):
+            return any(ip in topology for _, topology, _ in found.values())
+
+        found, failures = self._discover_clusters(ips, covered)
+        for ip, e in failures:
+            if not covered(ip, found):
+                if e:
+                    raise e
+                raise HostIsDown("Could not fetch topology from host %s. Is Cassandra actually running?" % (ip,))
+        return self._add_clusters(found)
+
+    def _discover_clusters(self, hosts, covered):
+        """Describe the cluster of each host, DISCOVERY_WORKERS hosts at a time.
+
+        The first answer for each cluster wins. Hosts for which covered(host, found) becomes true before they are
+        asked are skipped, and their answer is ignored if they are already being asked. Returns a dict from cluster
+        name to a (schema version, topology, keyspace replication) tuple, and a list of (host, exception or None)
+        tuples for hosts that failed."""
+        found = {}
+        failures = []
+        queued = collections.deque(hosts)
+        running = {}
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=DISCOVERY_WORKERS)
         try:
-            cache_file = self.get_cache_file_path(cache_type)
-            if os.path.exists(cache_file):
-                debug("Getting {} from cache".format(cache_type))
-                cached_data = pickle.load(open(cache_file, 'rb'))
-                return cached_data
-        except Exception:
-            warn("Failed getting data from cache : {}".format(sys.exc_info()[2]))
-        debug("Cache miss for {}".format(cache_type))
-        return None
+            while True:
+                # Only start as many hosts as there are workers, so that covered hosts are skipped, not asked
+                while queued and len(running) < DISCOVERY_WORKERS:
+                    host = queued.popleft()
+                    if not covered(host, found):
+                        running[executor.submit(self._describe_cluster, host)] = host
+                if not running:
+                    break
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    host = running.pop(future)
+                    try:
+                        answer = future.result()
+                    except BadSSHHost as e:
+                        failures.append((host, e))
+                        continue
+                    if answer is None:
+                        failures.append((host, None))
+                        continue
+                    cluster_name = answer[0]
+                    if cluster_name not in found:
+                        found[cluster_name] = answer[1:]
+                for future, host in list(running.items()):
+                    if covered(host, found):
+                        del running[future]
+        finally:
+            # Don't wait for stragglers, their answers are not needed anymore. Their nodetool still runs to the end
+            # on the host, which is why few hosts are asked at a time.
+            executor.shutdown(wait=False)
+        return found, failures
+
+    def _describe_cluster(self, host):
+        """Run describecluster and status on host concurrently, in a single remote shell. Returns (cluster name,
+        schema version, topology, keyspace replication), or None if nodetool failed."""
+        with self.connection(host) as conn:
+            describe_res, status_res = self.run_nodetool_batch(conn, (("describecluster",), ("status",)),
+                                                               parallel=True)
+        if (describe_res.status != 0) or (status_res.status != 0):
+            return None
+        (cluster_name, schema_version) = cstar.nodetoolparser.parse_describe_cluster(describe_res.out)
+        topology = cstar.nodetoolparser.parse_nodetool_status(status_res.out, cluster_name, self.reverse_dns_preheat, self.resolve_hostnames)
+        replication = cstar.nodetoolparser.parse_keyspace_replication(describe_res.out)
+        return cluster_name, schema_version, topology, replication
+
+    def _add_clusters(self, found):
+        """Remember the schema version, topology hash and keyspace replication of each cluster in found, and return
+        their topology"""
+        final_topology = set()
+        for cluster_name, (schema_version, topology, replication) in found.items():
+            self._cluster_versions[cluster_name] = (schema_version, topology.get_hash())
+            self._keyspace_replication[cluster_name] = replication
+            final_topology.update(topology.hosts)
+        self.schema_versions = [self._cluster_versions[name][0] for name in sorted(self._cluster_versions)]
+        self.status_topology_hash = [self._cluster_versions[name][1] for name in sorted(self._cluster_versions)]
+        return Topology(final_topology)
+
+    def get_cache_key(self):
+        return cstar.cache.cache_key(self.schema_versions, self.status_topology_hash)
+
+    @property
+    def resolver(self):
+        """The DNS resolver of this job, caching answers in the cache directory"""
+        with self._resolver_lock:
+            if self._resolver is None:
+                cache_file = os.path.join(self.cache_directory, "dns.json") if self.cache_directory else None
+                self._resolver = cstar.resolver.Resolver(cache_file)
+            return self._resolver
 
     def reverse_dns_preheat(self, ips):
-        if self.is_preheated:
-            return
-        self.is_preheated = True
-
-        def get_host_by_addr(ip):
-            try:
-                socket.gethostbyaddr(ip)
-            except socket.herror:
-                pass
-
-        def create_lookup_thread(ip):
-            return threading.Thread(target=lambda: get_host_by_addr(ip))
-
-        print("Preheating DNS cache")
-        threads = [create_lookup_thread(ip) for ip in set(ips)]
-
-        for thread in threads:
-            thread.start()
-
-        for thread in threads:
-            # Don't wait around forever for slow DNS
-            thread.join(1.0)
-        print("Preheating done")
+        """Look up the host names of all ips at once, and return them as a dict from ip to host name"""
+        debug("Resolving host names")
+        return self.resolver.reverse_lookup_all(ips)
 
     def get_keyspaces(self, conn):
         cfstats_output = self.run_nodetool(conn, *("cfstats", "|", "grep", "Keyspace"))
@@ -181,7 +258,8 @@ class Job(object):
         mappings = []
         count = 0
 
-        endpoint_mappings = self.maybe_get_data_from_cache("endpoint_mapping")
+        cache = cstar.cache.EndpointMappingCache(self.cache_directory)
+        endpoint_mappings = cache.get(self.get_cache_key(), topology)
         if endpoint_mappings is not None:
             return endpoint_mappings
 
@@ -191,25 +269,26 @@ class Job(object):
                 continue
 
             count = 0
-            conn = self._connection(host)
-
-            if self.key_space:
-                keyspaces = [self.key_space]
-            else:
-                keyspaces = self.get_keyspaces(conn)
-            has_error = True
-            for keyspace in keyspaces:
-                if not keyspace.startswith("system"):
-                    debug("Fetching endpoint mapping for keyspace", keyspace)
-                    res = self.run_nodetool(conn, *("describering", keyspace))
-                    has_error = False
-
-                    if res.status != 0 and not keyspace.startswith("system"):
+            replication = self._keyspace_replication.get(host.cluster, {})
+            with self.connection(host) as conn:
+                if self.key_space:
+                    keyspaces = [self.key_space]
+                elif replication:
+                    keyspaces = sorted(replication)
+                else:
+                    keyspaces = self.get_keyspaces(conn)
+                keyspaces = [keyspace for keyspace in keyspaces if not keyspace.startswith("system")]
+                # Keyspaces with the same replication settings have the same replicas, one of them is enough
+                keyspaces = one_keyspace_per_replication(keyspaces, replication)
+                debug("Fetching endpoint mapping for keyspaces", ", ".join(keyspaces))
+                results = self.run_nodetool_batch(conn, [("describering", keyspace) for keyspace in keyspaces])
+                has_error = not keyspaces
+                for res in results:
+                    if res.status != 0:
                         has_error = True
                         break
-                    describering = cstar.nodetoolparser.parse_nodetool_describering(res.out)
-                    range_mapping = cstar.nodetoolparser.convert_describering_to_range_mapping(describering)
-                    mappings.append(cstar.endpoint_mapping.parse(range_mapping, topology, lookup=ip_lookup))
+                    endpoints = cstar.nodetoolparser.parse_describering_endpoints(res.out)
+                    mappings.append(cstar.endpoint_mapping.parse_endpoints(endpoints, topology, lookup=self.resolver.lookup))
 
             if has_error:
                 if count >= MAX_ATTEMPTS:
@@ -224,15 +303,15 @@ class Job(object):
             raise HostIsDown("Following hosts couldn't be reached: {}".format(', '.join(host.fqdn for host in failed_hosts)))
 
         endpoint_mappings = cstar.endpoint_mapping.merge(mappings)
-        pickle.dump(dict(endpoint_mappings), open(self.get_cache_file_path("endpoint_mapping"), 'wb'))
+        cache.put(self.get_cache_key(), endpoint_mappings)
         return endpoint_mappings
 
-    def run_nodetool(self, conn, *cmds):
+    def _nodetool_argv(self, *cmds):
         sudo=[]
         if self.use_sudo:
             sudo.append('sudo')
             if self.sudo_args:
-                sudo.append(self.sudo_args.split())
+                sudo.extend(self.sudo_args.split())
 
         jmx_args=[]
         if self.jmx_username:
@@ -244,8 +323,28 @@ class Job(object):
         if self.addl_jmx_args:
             self.addl_jmx_args = self.addl_jmx_args.replace('\\','')
             jmx_args.extend([self.addl_jmx_args])
-            
-        return conn.run((*sudo, "nodetool", *jmx_args, *cmds))
+
+        return (*sudo, "nodetool", *jmx_args, *cmds)
+
+    def run_nodetool(self, conn, *cmds):
+        return conn.run(self._nodetool_argv(*cmds))
+
+    def run_nodetool_batch(self, conn, commands, parallel=False):
+        """Run several nodetool commands in a single remote shell, and return one ExecutionResult per command.
+
+        Each command still starts its own nodetool JVM, but this saves an SSH round-trip per command. With parallel
+        set, the commands run concurrently on the host."""
+        delimiter = "cstar-batch-" + uuid.uuid4().hex
+        argvs = [self._nodetool_argv(*cmds) for cmds in commands]
+        res = conn.run(("sh", "-c", cstar.nodetoolparser.make_batch_script(argvs, delimiter, parallel)))
+        results = cstar.nodetoolparser.split_batch_output(res.out, res.err, delimiter, argvs)
+        # The batch script itself always succeeds, so report the commands that did not
+        for result in results:
+            if result.status == -1:
+                err("Command %s was interrupted on host %s" % (result.command, conn.hostname))
+            elif result.status != 0:
+                err("Command %s failed with status %d on host %s" % (result.command, result.status, conn.hostname))
+        return results
 
     def setup(self, hosts, seeds, command, job_id, strategy, cluster_parallel, dc_parallel, job_runner,
               max_concurrency, timeout, env, use_sudo, sudo_args, stop_after, key_space, output_directory,
@@ -253,7 +352,8 @@ class Job(object):
               sleep_on_new_runner, sleep_after_done,
               ssh_username, ssh_password, ssh_identity_file, ssh_lib,
               jmx_username, jmx_password, jmx_passwordfile, addl_jmx_args, 
-              resolve_hostnames, hosts_variables):
+              resolve_hostnames, hosts_variables, engine=THREADS_ENGINE,
+              max_workers=cstar.runnerpool.DEFAULT_MAX_WORKERS):
 
         msg("Starting setup")
 
@@ -283,6 +383,8 @@ class Job(object):
         self.addl_jmx_args = addl_jmx_args
         self.resolve_hostnames = resolve_hostnames
         self.hosts_variables = hosts_variables
+        self.engine = engine
+        self.max_workers = max_workers
         if not os.path.exists(self.output_directory):
             os.makedirs(self.output_directory)
         if not os.path.exists(self.cache_directory):
@@ -296,13 +398,10 @@ class Job(object):
             if dc_filter:
                 original_topology = original_topology.with_dc_filter(dc_filter)
         else:
-            current_topology = cstar.topology.Topology()
-            hosts_ip_set = set(socket.gethostbyname(host) for host in hosts)
-            for raw_host in hosts:
-                host = socket.gethostbyname(raw_host)
-                if host in current_topology:
-                    continue
-                current_topology = current_topology | self.get_cluster_topology((host,))
+            addresses = self.resolver.lookup_all(hosts)
+            hosts_ips = list(collections.OrderedDict.fromkeys(addresses[host] for host in hosts))
+            hosts_ip_set = set(hosts_ips)
+            current_topology = self.get_hosts_topology(hosts_ips)
             original_topology = cstar.topology.Topology(host for host in current_topology if host.ip in hosts_ip_set)
         msg("Done loading cluster topology")
 
@@ -329,39 +428,57 @@ class Job(object):
             seeds = self.state.get_idle().with_cluster(cluster).without_hosts(skip_nodes).get_up()
             # When using the all strategy, all nodes go to running, so we need to pick some node
             seeds = seeds or self.state.current_topology.with_cluster(cluster).get_up()
-            new_topology = new_topology | self.get_cluster_topology(seeds)
+            new_topology = new_topology | self.get_cluster_topology(seeds, cluster)
         self.state = self.state.with_topology(new_topology)
 
+    def check_endpoint_mapping(self, schema_versions, topology_hash):
+        """Fetch the endpoint mapping again if the schema versions or topology hashes of the current topology differ
+        from the ones the mapping was saved with"""
+        if self.state.strategy is not cstar.strategy.Strategy.TOPOLOGY:
+            return
+        if self.schema_versions == schema_versions and self.status_topology_hash == topology_hash:
+            return
+        msg("Schema or topology changed since the job was saved, fetching the endpoint mapping again")
+        self.state = self.state.with_endpoint_mapping(self.get_endpoint_mapping(self.state.original_topology))
+
+    def check_nodes_returned(self, nodes=()):
+        """Refresh the current topology once and return whether all nodes are back up"""
+        try:
+            self.update_current_topology(nodes)
+
+            if self.state.is_healthy():
+                return True
+        except BadSSHHost as e:
+            # If the instance used to poll cluster health is down it probably means that machine is rebooting
+            # State is then NOT healthy, so continue waiting...
+            debug("SSH to %s failed, instance down?" % (", ".join(str(node) for node in nodes), ), e)
+        cstar.jobprinter.print_progress(self.state.original_topology,
+                                        self.state.progress,
+                                        self.state.current_topology.get_down())
+        return False
+
     def wait_for_node_to_return(self, nodes=()):
         """Wait until node returns"""
-        while True:
-            try:
-                self.update_current_topology(nodes)
-
-                if self.state.is_healthy():
-                    break
-            except BadSSHHost as e:
-                # If the instance used to poll cluster health is down it probably means that machine is rebooting
-                # State is then NOT healthy, so continue waiting...
-                debug("SSH to %s failed, instance down?" % (node, ), e)
-            cstar.jobprinter.print_progress(self.state.original_topology,
-                                            self.state.progress,
-                                            self.state.current_topology.get_down())
-            time.sleep(5)
+        nodes = tuple(nodes)
+        while not self.check_nodes_returned(nodes):
+            time.sleep(NODE_RETURN_POLL_INTERVAL)
 
     def resume(self):
+        schema_versions, topology_hash = self.schema_versions, self.status_topology_hash
         self.update_current_topology()
+        self.check_endpoint_mapping(schema_versions, topology_hash)
+        if self.engine == ASYNCIO_ENGINE:
+            cstar.asyncengine.AsyncEngine(self, self.max_workers).run(resume_hosts=self.state.progress.running)
+            return
         self.resume_on_running_hosts()
         self.run()
 
     def run(self):
-        self.do_loop = True
+        if self.engine == ASYNCIO_ENGINE:
+            cstar.asyncengine.AsyncEngine(self, self.max_workers).run()
+            return
 
-        cstar.jobwriter.write(self)
-        if not self.state.is_healthy():
-            raise HostIsDown(
-                "Can't run job because hosts are down: " + ", ".join(
-                    host.fqdn for host in self.state.current_topology.get_down()))
+        self.begin_run()
 
         while self.do_loop:
             self.schedule_all_runnable_jobs()
@@ -372,6 +489,22 @@ class Job(object):
             self.wait_for_any_job()
 
         self.wait_for_all_jobs()
+        self.end_run()
+
+    def begin_run(self):
+        self.do_loop = True
+
+        cstar.jobwriter.write(self)
+        if not self.state.is_healthy():
+            raise HostIsDown(
+                "Can't run job because hosts are down: " + ", ".join(
+                    host.fqdn for host in self.state.current_topology.get_down()))
+
+        if self.state.strategy is cstar.strategy.Strategy.TOPOLOGY:
+            msg("Expected number of waves:", self.state.expected_waves())
+
+    def end_run(self):
+        cstar.jobwriter.write(self)
         cstar.jobprinter.print_progress(self.state.original_topology,
                                         self.state.progress,
                                         self.state.current_topology.get_down())
@@ -380,14 +513,11 @@ class Job(object):
     def resume_on_running_hosts(self):
         for host in self.state.progress.running:
             debug("Resume on host", host.fqdn)
-            threading.Thread(target=self.job_runner(self, host, self.ssh_username, self.ssh_password, self.ssh_identity_file, self.ssh_lib, self.hosts_variables),
-                             name="cstar %s" % host.fqdn).start()
-            time.sleep(self.sleep_on_new_runner)
+            self.runner_pool.submit(self.new_runner(host), host)
 
     def print_outcome(self):
         if self.state.is_done() and not self.errors:
             if len(self.state.progress.done) == self.state.stop_after:
-                cstar.jobwriter.write(self)
                 msg("Job", self.job_id, "successfully ran on", self.state.stop_after, "hosts.\nTo finish the job, run",
                     emph("cstar continue %s" % (self.job_id,)))
 
@@ -429,6 +559,7 @@ class Job(object):
             if result.status != 0:
                 self.errors.append((host, result))
                 self.state = self.state.with_failed(host)
+                cstar.jobwriter.append(self, host, cstar.jobwriter.FAILED)
                 msg("Failure on host", host.fqdn)
                 if result.out:
                     msg("stdout:", result.out)
@@ -437,6 +568,7 @@ class Job(object):
                 self.do_loop = False
             else:
                 self.state = self.state.with_done(host)
+                cstar.jobwriter.append(self, host, cstar.jobwriter.DONE)
                 info("Host %s finished successfully" % (host.fqdn,))
                 if result.out:
                     info("stdout:", result.out, sep="\n")
@@ -445,14 +577,39 @@ class Job(object):
                 if self.sleep_after_done:
                     debug("Sleeping %d seconds..." % self.sleep_after_done)
                     time.sleep(self.sleep_after_done)
-        cstar.jobwriter.write(self)
-        # Signal the jobrunner that it can delete the remote job files and terminate.
+        # Once the results are on disk, the remote job files can be deleted.
         for finished_job in finished_jobs:
             host, result = finished_job
-            self.handled_finished_jobs.add(host)
+            self._acknowledge(host)
+
+    def when_handled(self, host, callback):
+        """Run callback once the result of host has been written to the job journal.
+
+        Must be called before the result of host is put on the results queue."""
+        with self._handled_lock:
+            self._handled_callbacks[host] = callback
+
+    def _acknowledge(self, host):
+        with self._handled_lock:
+            callback = self._handled_callbacks.pop(host, None)
+        if callback:
+            self._cleanup_executor.submit(self._after_sync, callback)
+
+    def _after_sync(self, callback):
+        cstar.jobwriter.sync(self)
+        callback()
 
     def schedule_all_runnable_jobs(self):
-        while True:
+        for host in self.runnable_hosts():
+            self.schedule_job(host)
+
+    def runnable_hosts(self):
+        """Mark every host that can be run on next as running, and yield it so that it can be started.
+
+        No more hosts are marked running than there are runner pool workers, so that every running host has been
+        started. Hosts queued behind busy workers would still start after a failure or ^C stopped the job."""
+        scheduled = False
+        while len(self.state.progress.running) < self.max_workers:
             next_host = self.state.find_next_host()
             if not next_host:
                 if not self.state.progress.running:
@@ -460,30 +617,46 @@ class Job(object):
                 break
             if (not next_host.is_up) and self.state.ignore_down_nodes:
                 self.state = self.state.with_done(next_host)
+                cstar.jobwriter.append(self, next_host, cstar.jobwriter.DONE)
             else:
                 self.state = self.state.with_running(next_host)
-                self.schedule_job(next_host)
-            cstar.jobwriter.write(self)
+                cstar.jobwriter.append(self, next_host, cstar.jobwriter.RUNNING)
+                yield next_host
+            scheduled = True
+        if scheduled:
             cstar.jobprinter.print_progress(self.state.original_topology,
                                             self.state.progress,
                                             self.state.current_topology.get_down())
 
     def schedule_job(self, host):
         debug("Running on host", host.fqdn)
-        threading.Thread(target=self.job_runner(self, host, self.ssh_username, self.ssh_password, self.ssh_identity_file, self.ssh_lib, self.get_host_variables(host)),
-                         name="cstar %s" % host.fqdn).start()
-        time.sleep(self.sleep_on_new_runner)
+        self.runner_pool.submit(self.new_runner(host), host)
+
+    @property
+    def runner_pool(self):
+        """The pool that runs the job runners of this job, at most max_workers at a time"""
+        if self._runner_pool is None:
+            self._runner_pool = cstar.runnerpool.RunnerPool(self.max_workers, self.sleep_on_new_runner or 0)
+        return self._runner_pool
+
+    def new_runner(self, host):
+        return self.job_runner(self, host, self.ssh_username, self.ssh_password, self.ssh_identity_file, self.ssh_lib, self.get_host_variables(host))
+
+    def _new_connection(self, host):
+        return cstar.remote.Remote(host, self.ssh_username, self.ssh_password, self.ssh_identity_file, self.ssh_lib, self.get_host_variables(host))
 
-    def _connection(self, host):
-        if host not in self._connections:
-            self._connections[host] = cstar.remote.Remote(host, self.ssh_username, self.ssh_password, self.ssh_identity_file, self.ssh_lib, self.get_host_variables(host))
-        return self._connections[host]
+    def connection(self, host):
+        """Lease the pooled connection to host, for use in a with statement"""
+        return self._pool.lease(host)
 
     def close(self):
-        for name, conn in self._connections.items():
-            if conn:
-                conn.close()
-        self._connections = {}
+        if self._runner_pool:
+            self._runner_pool.shutdown(wait=True)
+        self._cleanup_executor.shutdown(wait=True)
+        self._pool.close()
+        cstar.jobwriter.close(self)
+        if self._resolver:
+            self._resolver.save()
 
     def get_host_variables(self, host):
         hostname = host
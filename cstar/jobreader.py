@@ -16,38 +16,113 @@ import datetime
 import json
 import os
 
+import cstar.job
 import cstar.jobrunner
 import cstar.jobwriter
+import cstar.runnerpool
 import cstar.strategy
 import cstar.topology
 from cstar.exceptions import BadFileFormatVersion, FileTooOld
-from cstar.output import debug
+from cstar.output import debug, warn
 
 
 def read(job, job_id, stop_after, output_directory=None, max_days=7, endpoint_mapper=None, retry=False):
     output_directory = output_directory or os.path.expanduser("~/.cstar/jobs/" + job_id)
-    file = output_directory + "/job.json"
 
     if not endpoint_mapper:
         endpoint_mapper = job.get_endpoint_mapping
 
-    with open(file) as f:
-        return _parse(f.read(), file, output_directory, job, job_id, stop_after, max_days, endpoint_mapper, retry)
-    return job
-
-
-def _parse(input, file, output_directory, job, job_id, stop_after, max_days, endpoint_mapper, retry=False):
+    # Transitions after the snapshot of the previous generation are in its journal and in the current one
+    journal = []
+    for name in (cstar.jobwriter.PREVIOUS_JOURNAL_FILE, cstar.jobwriter.JOURNAL_FILE):
+        path = os.path.join(output_directory, name)
+        if os.path.exists(path):
+            with open(path) as f:
+                journal.extend(f.readlines())
+
+    input, file = _read_job_file(output_directory)
+    return _parse(input, file, output_directory, job, job_id, stop_after, max_days, endpoint_mapper, retry, journal)
+
+
+def _read_job_file(output_directory):
+    """Return the contents and name of the job file, or of the previous generation if it is missing or corrupt"""
+    first_error = None
+    for name in (cstar.jobwriter.JOB_FILE, cstar.jobwriter.PREVIOUS_JOB_FILE):
+        file = os.path.join(output_directory, name)
+        try:
+            with open(file) as f:
+                input = f.read()
+            json.loads(input)
+        except (OSError, ValueError) as e:
+            first_error = first_error or e
+            continue
+        if first_error:
+            warn("Could not read the job file, using the previous one:", first_error)
+        return input, file
+    raise first_error
+
+
+def job_age(creation_timestamp):
+    """Age in whole days of a job file created at creation_timestamp"""
+    creation_time = datetime.datetime.utcfromtimestamp(creation_timestamp)
+    return (datetime.datetime.utcnow() - creation_time).days
+
+
+def read_metadata(output_directory):
+    """Return the metadata of the job in output_directory, as written by cstar.jobwriter.
+
+    Raises OSError or ValueError if there is none or it can't be read."""
+    with open(os.path.join(output_directory, cstar.jobwriter.METADATA_FILE)) as f:
+        metadata = json.load(f)
+    if metadata.get("version") != cstar.jobwriter.METADATA_FORMAT_VERSION:
+        raise ValueError("Unsupported job metadata version %s" % (metadata.get("version"),))
+    return metadata
+
+
+def _host_decoder(version, state):
+    """Return a function that turns a list of hosts as written in the job file into Host instances"""
+    if version < 10:
+        return lambda arrs: [cstar.topology.Host(*arr) for arr in arrs]
+    table = [cstar.topology.Host(*arr) for arr in state['hosts']]
+    return lambda ids: [table[i] for i in ids]
+
+
+def _endpoint_mapping(pairs, hosts, topology):
+    by_ip = topology.hosts_by_ip
+    host_list = hosts([host for host, _ in pairs])
+    # Prefer the hosts of the topology, so that the mapping and the topology agree on the state of each host
+    return dict((by_ip.get(host.ip, host), set(by_ip.get(neighbour.ip, neighbour) for neighbour in hosts(neighbours)))
+                for host, (_, neighbours) in zip(host_list, pairs))
+
+
+def _replay(progress, records, hosts_by_ip):
+    for _, ip, transition in records:
+        host = hosts_by_ip.get(ip)
+        if not host:
+            warn("Ignoring journal record for unknown host", ip)
+        elif transition == cstar.jobwriter.RUNNING:
+            progress = progress.with_running(host)
+        elif transition == cstar.jobwriter.DONE:
+            progress = progress.with_done(host)
+        elif transition == cstar.jobwriter.FAILED:
+            progress = progress.with_failed(host)
+        else:
+            warn("Ignoring journal record with unknown transition", transition)
+    return progress
+
+
+def _parse(input, file, output_directory, job, job_id, stop_after, max_days, endpoint_mapper, retry=False,
+           journal=()):
     data = json.loads(input)
 
     if 'version' not in data:
         raise BadFileFormatVersion("Incompatible file format version, wanted %d" %
                                    (cstar.jobwriter.FILE_FORMAT_VERSION,))
-    if data['version'] != cstar.jobwriter.FILE_FORMAT_VERSION:
+    if data['version'] not in cstar.jobwriter.READABLE_FILE_FORMAT_VERSIONS:
         raise BadFileFormatVersion("Incompatible file format version, wanted %d but %s is of version %d" %
                                    (cstar.jobwriter.FILE_FORMAT_VERSION, file, data['version']))
 
-    creation_time = datetime.datetime.utcfromtimestamp(data["creation_timestamp"])
-    age = (datetime.datetime.utcnow() - creation_time).days
+    age = job_age(data["creation_timestamp"])
     if age > max_days:
         raise FileTooOld(("Job created %d days ago, which is more than the current maximum age of %d. " +
                           "Use --max-job-age %d if you really want to run this job.") % (age, max_days, age + 1))
@@ -71,6 +146,11 @@ def _parse(input, file, output_directory, job, job_id, stop_after, max_days, end
     job.jmx_passwordfile = data['jmx_passwordfile']
     job.addl_jmx_args = data['addl_jmx_args']
     job.hosts_variables = data['hosts_variables']
+    job.engine = data['engine'] if 'engine' in data else cstar.job.THREADS_ENGINE
+    job.max_workers = data.get('max_workers', cstar.runnerpool.DEFAULT_MAX_WORKERS)
+    # The endpoint mapping saved in the job file is only valid as long as these don't change, see Job.resume
+    job.schema_versions = data.get('schema_versions', [])
+    job.status_topology_hash = data.get('status_topology_hash', [])
 
     strategy = cstar.strategy.parse(state['strategy'])
     cluster_parallel = state['cluster_parallel']
@@ -80,21 +160,31 @@ def _parse(input, file, output_directory, job, job_id, stop_after, max_days, end
     job.resolve_hostnames = state['resolve_hostnames'] if 'resolve_hostnames' in state.keys() else False
     job.cache_directory = state['cache_directory'] if 'cache_directory' in state.keys() else os.path.expanduser("~/.cstar/cache")
 
+    hosts = _host_decoder(data['version'], state)
     progress = cstar.progress.Progress(
-        running=[cstar.topology.Host(*arr) for arr in state['progress']['running']],
-        done=[cstar.topology.Host(*arr) for arr in state['progress']['done']],
-        failed=[cstar.topology.Host(*arr) for arr in state['progress']['failed']])
+        running=hosts(state['progress']['running']),
+        done=hosts(state['progress']['done']),
+        failed=hosts(state['progress']['failed']))
+
+    original_topology = cstar.topology.Topology(hosts(state['original_topology']))
+
+    # Transitions recorded after the job file was last written
+    journal_seq = data.get('journal_seq', 0)
+    records = cstar.jobwriter.read_journal(journal, journal_seq)
+    progress = _replay(progress, records, original_topology.hosts_by_ip)
+    job._writer = cstar.jobwriter.JobWriter(output_directory, records[-1][0] if records else journal_seq)
 
     if retry==True:
         progress.failed = set([])
 
-    original_topology = cstar.topology.Topology(cstar.topology.Host(*arr) for arr in state['original_topology'])
-    current_topology = cstar.topology.Topology(cstar.topology.Host(*arr) for arr in state['current_topology'])
+    current_topology = cstar.topology.Topology(hosts(state['current_topology']))
 
     debug("Run on hosts", original_topology)
     debug("in topology", current_topology)
 
-    if strategy is cstar.strategy.Strategy.TOPOLOGY:
+    if strategy is cstar.strategy.Strategy.TOPOLOGY and 'endpoint_mapping' in state:
+        endpoint_mapping = _endpoint_mapping(state['endpoint_mapping'], hosts, original_topology)
+    elif strategy is cstar.strategy.Strategy.TOPOLOGY:
         endpoint_mapping = endpoint_mapper(original_topology)
     else:
         endpoint_mapping = None
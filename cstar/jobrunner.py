@@ -12,25 +12,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import cstar.remote
 import cstar.jobwriter
 import subprocess
 import shlex
 import os
-import time
 
+from cstar.exceptions import BadSSHHost
 from cstar.executionresult import ExecutionResult
+from cstar.output import warn
 
 
-def save_output(job, host, result):
+def host_output_directory(job, host):
     output_directory = job.output_directory + "/" + host.fqdn
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
+    return output_directory
 
-    with open(output_directory + "/out", 'w') as f:
-        f.write(result.out)
-    with open(output_directory + "/err", 'w') as f:
-        f.write(result.err)
+
+def save_output(job, host, result, streamed=False):
+    """Save the result of host. When streamed is set, out and err were already written while the job ran."""
+    output_directory = host_output_directory(job, host)
+
+    if not streamed:
+        with open(output_directory + "/out", 'w') as f:
+            f.write(result.out)
+        with open(output_directory + "/err", 'w') as f:
+            f.write(result.err)
     with open(output_directory + "/status", 'w') as f:
         f.write(str(result.status))
 
@@ -57,17 +64,24 @@ class RemoteJobRunner(object):
         self.host_variables = host_variables
 
     def __call__(self):
-        with cstar.remote.Remote(self.host, self.ssh_username, self.ssh_password, self.ssh_identity_file, self.ssh_lib, self.host_variables) as conn:
-            result = conn.run_job(self.job.command, self.job.job_id, self.job.timeout, self.job.env)
-            self.job.results.put((self.host, result))  # This signals the main thread that the job completed.
-            save_output(self.job, self.host, result)
-            # We have to make sure that the local job file is updated before the remote
-            # job data is deleted. We need to syncronize with the main thread.
-            while self.host not in self.job.handled_finished_jobs:
-                time.sleep(1)
-            conn.run(("rm", "-rf", ".cstar/remote-jobs/" + self.job.job_id))
+        output_directory = host_output_directory(self.job, self.host)
+        with self.job.connection(self.host) as conn:
+            result = conn.run_job(self.job.command, self.job.job_id, self.job.timeout, self.job.env,
+                                  output_directory=output_directory)
+        save_output(self.job, self.host, result, streamed=True)
+        # We have to make sure that the local job file is updated before the remote
+        # job data is deleted, so leave that to the main thread once it has handled the result.
+        self.job.when_handled(self.host, self.cleanup)
+        self.job.results.put((self.host, result))  # This signals the main thread that the job completed.
         return result
 
+    def cleanup(self):
+        try:
+            with self.job.connection(self.host) as conn:
+                conn.run(("rm", "-rf", ".cstar/remote-jobs/" + self.job.job_id))
+        except BadSSHHost as e:
+            warn("Could not delete remote job files on host %s:" % (self.host.fqdn,), e)
+
 
 class LocalJobRunner(object):
     """Job runners are responsible for running a command to completion for a specific host and reporting back the
@@ -14,18 +14,62 @@
 
 import json
 import datetime
+import os
+import threading
+import time
 
 import cstar.strategy
 import cstar.job
 import cstar.state
 import cstar.progress
 import cstar.topology
+from cstar.output import warn
 
-FILE_FORMAT_VERSION = 8
+FILE_FORMAT_VERSION = 11
+# Versions that cstar.jobreader can still read. Version 8 job files have no journal, versions before 10 write
+# every host in full wherever it appears, and versions before 11 have no endpoint mapping.
+READABLE_FILE_FORMAT_VERSIONS = {8, 9, 10, 11}
 
+JOB_FILE = "job.json"
+JOURNAL_FILE = "job.journal"
+# A small summary of the job, so that jobs can be listed and cleaned up without reading the job file
+METADATA_FILE = "job-meta.json"
+METADATA_FORMAT_VERSION = 1
+# The previous generation of the job file and its journal, kept in case the current one is unreadable
+PREVIOUS_JOB_FILE = "job.json.prev"
+PREVIOUS_JOURNAL_FILE = "job.journal.prev"
+# Queued snapshots and transitions are written at most once per interval, unless someone waits for them
+FLUSH_INTERVAL = 0.2
+# The job file is rewritten, and the journal emptied, after this many records
+JOURNAL_COMPACT_RECORDS = 1024
 
-def _to_dict(child):
-    if type(child) is set:
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# Status of a job that has neither failed nor run on every host
+UNFINISHED = "unfinished"
+
+
+class _HostTable(object):
+    """Numbers hosts in the order they are first seen, so that each one is written once"""
+
+    def __init__(self):
+        self.ids = {}
+        self.hosts = []
+
+    def id(self, host):
+        # Hosts compare by ip, but the current topology may have another state for the same host
+        key = tuple(host)
+        if key not in self.ids:
+            self.ids[key] = len(self.hosts)
+            self.hosts.append(list(host))
+        return self.ids[key]
+
+
+def _to_dict(child, hosts=None):
+    if hosts is not None and (type(child) is set or type(child) is cstar.topology.Topology):
+        return [hosts.id(host) for host in child]
+    if type(child) is set or type(child) is list:
         return list(child)
     if type(child) is cstar.topology.Topology:
         return list(child)
@@ -34,7 +78,7 @@ def _to_dict(child):
     if type(child) is cstar.state.State:
         return _state_to_dict(child)
     if type(child) is cstar.progress.Progress:
-        return _progress_to_dict(child)
+        return _progress_to_dict(child, hosts)
     if type(child) is cstar.job.Job:
         return _job_to_dict(child)
     return child
@@ -42,20 +86,26 @@ def _to_dict(child):
 
 def _state_to_dict(self):
     skip = {"endpoint_mapping", "stop_after"}
-    data = dict((key, _to_dict(val)) for key, val in self.__dict__.items() if
+    hosts = _HostTable()
+    data = dict((key, _to_dict(val, hosts)) for key, val in self.__dict__.items() if
                 not key.startswith('_') and key not in skip)
+    if self.endpoint_mapping is not None:
+        # Pairs of a host and its neighbours
+        data["endpoint_mapping"] = [[hosts.id(host), sorted(hosts.id(neighbour) for neighbour in neighbours)]
+                                    for host, neighbours in self.endpoint_mapping.items()]
+    data["hosts"] = hosts.hosts
     return data
 
 
-def _progress_to_dict(self):
+def _progress_to_dict(self, hosts=None):
     skip = {}
-    data = dict((key, _to_dict(val)) for key, val in self.__dict__.items() if
+    data = dict((key, _to_dict(val, hosts)) for key, val in self.__dict__.items() if
                 not key.startswith('_') and key not in skip)
     return data
 
 
 def _job_to_dict(self):
-    skip = {"results", "handled_finished_jobs", "do_loop", "job_id", "job_runner", "jmx_password"}
+    skip = {"results", "do_loop", "job_id", "job_runner", "jmx_password"}
     data = dict((key, _to_dict(val)) for key, val in self.__dict__.items() if key[0] != '_' and key not in skip)
     data["version"] = FILE_FORMAT_VERSION
     data["job_runner"] = self.job_runner.__name__
@@ -63,13 +113,218 @@ def _job_to_dict(self):
     return data
 
 
-def _job_to_json(job):
-    return json.dumps(_to_dict(job), sort_keys=True, indent=4)
+def _metadata(data, job_id):
+    state = data["state"]
+    progress = state["progress"]
+    hosts = len(state["original_topology"])
+    if progress["failed"]:
+        status = FAILED
+    elif len(progress["done"]) == hosts:
+        status = DONE
+    else:
+        status = UNFINISHED
+    return {"version": METADATA_FORMAT_VERSION,
+            "job_id": job_id,
+            "file_format_version": data["version"],
+            "creation_timestamp": data["creation_timestamp"],
+            "command": data["command"],
+            "status": status,
+            "hosts": hosts,
+            "done": len(progress["done"]),
+            "failed": len(progress["failed"]),
+            "running": len(progress["running"])}
+
+
+def _replace_if_exists(path, new_path):
+    try:
+        os.replace(path, new_path)
+    except FileNotFoundError:
+        pass
+
+
+class JobWriter(object):
+    """Writes the job file and the journal of host transitions of a job in directory, on a background thread.
+
+    Each journal line is a JSON record with a sequence number, the ip of a host and the state it moved to. The job
+    file is a snapshot of the job that records the sequence number of the last transition it includes. Snapshots and
+    transitions are queued in order, and written at most once every interval seconds so that a burst of them costs one
+    write and one fsync. Only the last queued snapshot is written.
+
+    A snapshot is written to a temporary file which is then renamed over the job file. The job file and journal it
+    replaces are kept as the previous generation. The metadata file is rewritten with every snapshot, so its host
+    counts do not include the transitions in the journal."""
+
+    def __init__(self, directory, seq=0, interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        # Sequence number of the last queued transition
+        self.seq = seq
+        # Transitions queued since the last snapshot
+        self.records = 0
+        self._cond = threading.Condition(threading.RLock())
+        self._queue = []
+        self._queued = 0
+        self._written = 0
+        self._wanted = 0
+        self._closing = False
+        self._thread = None
+        self._journal = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def append(self, host, transition):
+        with self._cond:
+            self.seq += 1
+            self.records += 1
+            self._put(json.dumps({"seq": self.seq, "host": host.ip, "transition": transition}) + "\n")
+
+    def snapshot(self, data):
+        with self._cond:
+            data["journal_seq"] = self.seq
+            self.records = 0
+            self._put(data)
+
+    def _put(self, item):
+        self._queue.append(item)
+        self._queued += 1
+        if not self._thread:
+            self._thread = threading.Thread(target=self._run, name="cstar job writer", daemon=True)
+            self._thread.start()
+        self._cond.notify_all()
+
+    def sync(self):
+        """Wait until everything queued so far is on disk"""
+        with self._cond:
+            target = self._queued
+            self._wanted = max(self._wanted, target)
+            self._cond.notify_all()
+            while self._written < target and self._thread and self._thread.is_alive():
+                self._cond.wait()
+
+    def close(self):
+        with self._cond:
+            self._closing = True
+        self.sync()
+        with self._cond:
+            self._cond.notify_all()
+            thread = self._thread
+        if thread:
+            thread.join()
+        self._close_journal()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closing:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                items, self._queue = self._queue, []
+            try:
+                self._write(items)
+            except Exception as e:
+                warn("Could not save job state in %s:" % (self.directory,), e)
+            with self._cond:
+                self._written += len(items)
+                self._cond.notify_all()
+                # Let more work pile up before writing again, unless someone is waiting for it
+                deadline = time.monotonic() + self.interval
+                while not self._closing and self._written >= self._wanted:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+    def _write(self, items):
+        snapshots = [i for i, item in enumerate(items) if type(item) is dict]
+        if snapshots:
+            # Transitions up to the last snapshot are part of it, and go to the journal it replaces
+            last = snapshots[-1]
+            self._write_records(item for item in items[:last] if type(item) is str)
+            self._write_snapshot(items[last])
+            items = items[last + 1:]
+        self._write_records(items)
+
+    def _write_records(self, records):
+        data = "".join(records)
+        if not data:
+            return
+        if not self._journal:
+            self._journal = open(self._path(JOURNAL_FILE), 'a')
+        self._journal.write(data)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _write_snapshot(self, data):
+        path = self._path(JOB_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps(data, sort_keys=True, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._close_journal()
+        # If cstar dies in between, the previous generation still has every transition
+        _replace_if_exists(path, self._path(PREVIOUS_JOB_FILE))
+        _replace_if_exists(self._path(JOURNAL_FILE), self._path(PREVIOUS_JOURNAL_FILE))
+        os.replace(tmp_path, path)
+
+        metadata_path = self._path(METADATA_FILE)
+        with open(metadata_path + ".tmp", 'w') as f:
+            json.dump(_metadata(data, os.path.basename(os.path.normpath(self.directory))), f, sort_keys=True)
+        os.replace(metadata_path + ".tmp", metadata_path)
+
+    def _close_journal(self):
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+
+def _writer(job):
+    if not job._writer:
+        job._writer = JobWriter(job.output_directory)
+    return job._writer
+
+
+def read_journal(lines, after_seq=0):
+    """Return the (seq, host ip, transition) records in lines that come after after_seq, in order.
+
+    A record that was only partly written when cstar died is skipped."""
+    records = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+            records.append((int(record["seq"]), record["host"], record["transition"]))
+        except (ValueError, KeyError, TypeError):
+            continue
+    return sorted(set(record for record in records if record[0] > after_seq))
 
 
 def write(job):
+    """Queue a snapshot of job to be written to the job file. It is written in the background, use sync() to wait
+    for it."""
     if not job.state:
         return False
-    with open(job.output_directory + "/job.json", 'w') as f:
-        f.write(_job_to_json(job) + "\n")
+    _writer(job).snapshot(_to_dict(job))
     return True
+
+
+def append(job, host, transition):
+    """Queue a record that host moved to transition (one of RUNNING, DONE or FAILED)"""
+    writer = _writer(job)
+    writer.append(host, transition)
+    if writer.records >= JOURNAL_COMPACT_RECORDS:
+        write(job)
+
+
+def sync(job):
+    """Wait until every queued snapshot and transition of job is on disk"""
+    if job._writer:
+        job._writer.sync()
+
+
+def close(job):
+    """Write everything that is queued and stop the writer of job"""
+    if job._writer:
+        job._writer.close()
+        job._writer = None
@@ -1,3 +1,5 @@
-from .describering import parse as parse_nodetool_describering, convert_describering_to_range_mapping
-from .simple import parse_describe_cluster, extract_keyspaces_from_cfstats
+from .describering import parse as parse_nodetool_describering, convert_describering_to_range_mapping, \
+    parse_endpoints as parse_describering_endpoints
+from .simple import parse_describe_cluster, extract_keyspaces_from_cfstats, parse_keyspace_replication
 from .status import parse_nodetool_status
+from .batch import make_batch_script, split_batch_output
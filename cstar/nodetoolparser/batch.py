@@ -0,0 +1,72 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run several commands in one remote shell, and split their combined output again.
+
+The output of every command is framed by a begin and an end line containing the delimiter, on stdout as well as on
+stderr. The end line on stdout also carries the exit status of the command."""
+
+import re
+import shlex
+
+from cstar.executionresult import ExecutionResult
+
+
+def _command_line(argv):
+    return " ".join(shlex.quote(arg) for arg in argv)
+
+
+def make_batch_script(commands, delimiter, parallel=False):
+    """Build a shell script running each argv in commands. When parallel is set the commands run concurrently, but
+    their output is still written in order."""
+    lines = []
+    if parallel:
+        lines.append('d=$(mktemp -d) || exit 1')
+        for i, argv in enumerate(commands):
+            lines.append('(%s >"$d/%d.out" 2>"$d/%d.err"; echo $? >"$d/%d.status") &' %
+                         (_command_line(argv), i, i, i))
+        lines.append('wait')
+    for i, argv in enumerate(commands):
+        lines.append('echo "%s begin %d"; echo "%s begin %d" >&2' % (delimiter, i, delimiter, i))
+        if parallel:
+            lines.append('cat "$d/%d.out"; cat "$d/%d.err" >&2; s=$(cat "$d/%d.status")' % (i, i, i))
+        else:
+            lines.append('%s; s=$?' % (_command_line(argv),))
+        lines.append('echo; echo "%s end %d $s"; echo >&2; echo "%s end %d" >&2' % (delimiter, i, delimiter, i))
+    if parallel:
+        lines.append('rm -rf "$d"')
+    lines.append('exit 0')
+    return "\n".join(lines) + "\n"
+
+
+def _sections(text, delimiter, with_status):
+    d = re.escape(delimiter)
+    if with_status:
+        pattern = r"^%s begin (\d+)\n(.*?)\n%s end \1 (-?\d+)$" % (d, d)
+    else:
+        pattern = r"^%s begin (\d+)\n(.*?)\n%s end \1()$" % (d, d)
+    return dict((int(m.group(1)), (m.group(2), m.group(3))) for m in re.finditer(pattern, text, re.M | re.S))
+
+
+def split_batch_output(out, err, delimiter, commands):
+    """Split the output of a script made by make_batch_script into one ExecutionResult per command. Commands that
+    did not report an exit status, because the script was interrupted, get status -1."""
+    out_sections = _sections(out, delimiter, True)
+    err_sections = _sections(err, delimiter, False)
+    results = []
+    for i, argv in enumerate(commands):
+        command_out, status = out_sections.get(i, ("", "-1"))
+        command_err, _ = err_sections.get(i, ("", ""))
+        results.append(ExecutionResult(_command_line(argv), int(status), command_out, command_err))
+    return results
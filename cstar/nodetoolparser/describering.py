@@ -49,7 +49,17 @@ expressions ::= expression ',' expressions | expression
 from collections import namedtuple
 from cstar.exceptions import ParseException
 import re
-ipv6_addr_re = re.compile('^(?<![:.\w])(?:[a-fA-F0-9]{1,4}:){7}[a-fA-F0-9]{1,4}(?![:.\w])')
+
+# Alternatives are tried in order, and whitespace between tokens is skipped by finditer. IPv6 addresses have to be
+# matched before numbers and identifiers, or the : would split them. Anything else that is not whitespace is an error.
+_token_re = re.compile(r"(?P<symbol>[()\[\],:])"
+                       r"|(?P<ipv6>(?:[a-fA-F0-9]{1,4}:){7}[a-fA-F0-9]{1,4}(?![:.\w]))"
+                       r"|(?P<int>-?\d+(?![\w.-]))"
+                       r"|(?P<identifier>(?:[^\W_]|-)[\w.-]*)"
+                       r"|(?P<error>\S)")
+
+# The endpoints argument of a TokenRange, but not rpc_endpoints
+_endpoints_re = re.compile(r"(?<![\w])endpoints:\[([^\]]*)\]")
 
 Call = namedtuple("Call", "name arguments")
 
@@ -66,6 +76,14 @@ class Identifier(object):
         self.offset = pos
 
 
+def parse_endpoints(text):
+    """Yield the endpoints of each token range in the output of describering as a tuple.
+
+    Unlike parse, this does not build an AST of the whole output, and only looks at the endpoints lists."""
+    for match in _endpoints_re.finditer(text):
+        yield tuple(endpoint.strip() for endpoint in match.group(1).split(",") if endpoint.strip())
+
+
 def parse(text):
     lines = list(filter(lambda x: x, [_parse_line(line) for line in text.split('\n')]))
     return lines
@@ -150,39 +168,22 @@ def _parse_describe_line_list(line, tokens):
     return res
 
 
-def _tokenize(original_line, offset=0):
-    line = original_line.lstrip()
-    offset += len(original_line) - len(line)
-    if not line:
-        return ()
-    if line[0] in {'(', ')', '[', ']', ',', ':'}:
-        return (Symbol(line[0], offset),) + _tokenize(line[1:], offset + 1)
-
-    # Handle an ipv6 address .. the : mucks the tokenizer .. :(
-    results=ipv6_addr_re.search(line)
-    if results:
-        tok = results.group()
-        offset = results.span()[1]
-        line = line[offset:]
-        identifier = Identifier(tok, offset)
-        return (identifier,) + _tokenize(line, offset + 1)
-
-    if line[0].isalnum() or line[0] in {'-'}:
-        tok = ""
-        while True:
-            tok += line[0]
-            line = line[1:]
-            if not line:
-                break
-            if not (line[0].isalnum() or line[0] in {'.', '_', '-'}):
-                break
-
-        if tok.isnumeric() or (tok[0] == '-' and tok[1:].isnumeric()):
-            identifier = Identifier(int(tok), offset)
+def _tokenize(line):
+    """Split line into a list of Symbols and Identifiers in a single pass"""
+    tokens = []
+    append = tokens.append
+    for match in _token_re.finditer(line):
+        kind = match.lastgroup
+        if kind == "symbol":
+            append(Symbol(match.group(), match.start()))
+        elif kind == "int":
+            append(Identifier(int(match.group()), match.start()))
+        elif kind == "error":
+            raise ParseException(line, match.start(), "Could not parse string")
         else:
-            identifier = Identifier(tok, offset)
-        return (identifier,) + _tokenize(line, offset + len(tok))
-    raise ParseException(line, offset, "Could not parse string")
+            append(Identifier(match.group(), match.start()))
+    return tokens
+
 
 def convert_describering_to_range_mapping(tokens):
     range_mapping = []
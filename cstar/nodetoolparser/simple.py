@@ -20,6 +20,7 @@ from cstar.topology import Topology, Host
 _cluster_name_re = re.compile(r"^\s*Name:\s*(.*)$", re.MULTILINE)
 _schema_version_re = re.compile(r"([0-9A-Fa-f]{8}(?:-[0-9A-Fa-f]{4}){3}-[0-9A-Fa-f]{12}): ", re.MULTILINE)
 _keyspace_name_re = re.compile(r"^\s*Keyspace\s*:\s*(.*)$", re.MULTILINE)
+_keyspace_replication_re = re.compile(r"^\s*(\S+) -> Replication class: (\S+) \{(.*)\}\s*$", re.MULTILINE)
 
 def parse_describe_cluster(text):
     return (_cluster_name_re.search(text).group(1), _schema_version_re.search(text).group(1))
@@ -27,3 +28,16 @@ def parse_describe_cluster(text):
 
 def extract_keyspaces_from_cfstats(text):
     return re.findall(_keyspace_name_re, text)
+
+
+def parse_keyspace_replication(text):
+    """Extract the replication settings of each keyspace from the output of describecluster.
+
+    Returns a dict from keyspace name to a normalized replication signature. Keyspaces with the same signature have
+    the same replicas for every token range. Only Cassandra 4.0 and later list keyspaces in describecluster, the dict
+    is empty for older versions."""
+    replication = {}
+    for keyspace, strategy, options in re.findall(_keyspace_replication_re, text):
+        options = ", ".join(sorted(option.strip() for option in options.split(",") if option.strip()))
+        replication[keyspace] = "%s {%s}" % (strategy.split(".")[-1], options)
+    return replication
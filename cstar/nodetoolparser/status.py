@@ -12,7 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import socket
 import re
 import ipaddress
 
@@ -60,19 +59,19 @@ def _parse_datacenter_name_and_nodes(datacenter_section):
 
 
 def parse_nodetool_status(text, cluster_name, reverse_dns_preheat, resolve_hostnames=False):
+    """Parse the output of nodetool status into a Topology.
+
+    If resolve_hostnames is set, reverse_dns_preheat is called with all addresses and should return a dict from
+    address to host name. Hosts missing from it are named by their address."""
     topology = []
     datacenter_sections = text.split("Datacenter: ")[1:]
     datacenter_names_and_nodes = [_parse_datacenter_name_and_nodes(section) for section in datacenter_sections]
+    names = {}
     if resolve_hostnames:
-        reverse_dns_preheat([node[1] for (_, nodes) in datacenter_names_and_nodes for node in nodes])
+        names = reverse_dns_preheat([node[1] for (_, nodes) in datacenter_names_and_nodes for node in nodes]) or {}
     for (datacenter_name, nodes) in datacenter_names_and_nodes:
         for node in nodes:
-            fqdn = node[1]
-            if resolve_hostnames:
-                try:
-                    fqdn=socket.gethostbyaddr(node[1])[0]
-                except socket.herror:
-                    pass
+            fqdn = names.get(node[1], node[1])
             topology.append(Host(fqdn=fqdn, ip=node[1], dc=datacenter_name, cluster=cluster_name,
                                  is_up=(node[0] == "UN"), rack=node[7], host_id=node[6]))
 
@@ -26,7 +26,11 @@ class Progress(object):
         self.failed = set(failed or [])
 
     def clone(self):
-        return copy.copy(self)
+        res = copy.copy(self)
+        res.done = set(self.done)
+        res.running = set(self.running)
+        res.failed = set(self.failed)
+        return res
 
     def with_running(self, host):
         res = self.clone()
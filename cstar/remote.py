@@ -21,14 +21,18 @@ class Remote(object):
         debug("Using ssh lib : ", ssh_lib)
         self.remote = RemoteParamiko(hostname, ssh_username, ssh_password, ssh_identity_file, host_variables)
 
+    @property
+    def hostname(self):
+        return self.remote.hostname
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
         self.remote.close()
 
-    def run_job(self, file, jobid, timeout=None, env={}):
-        return self.remote.run_job(file, jobid, timeout, env)
+    def run_job(self, file, jobid, timeout=None, env={}, output_directory=None):
+        return self.remote.run_job(file, jobid, timeout, env, output_directory)
 
     def get_job_status(self, jobid):
         pass
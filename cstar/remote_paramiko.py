@@ -14,16 +14,28 @@
 
 import paramiko.client
 import re
-import select
+import threading
+import time
 
 from cstar.output import err, debug, msg
 from cstar.exceptions import BadSSHHost, BadEnvironmentVariable, NoHostsSpecified
-from cstar.executionresult import ExecutionResult
+from cstar.executionresult import ExecutionResult, OutputTail
 from pkg_resources import resource_string
 
-PING_COMMAND = "echo ping"
-
 _alnum_re = re.compile(r"[^a-zA-Z0-9\|_]")
+# Printed by remote_job.sh once the job is done
+_finished_re = re.compile(rb"^cstar-job-finished (-?\d+)$", re.MULTILINE)
+
+# Number of bytes of the output of a job that is kept in memory when it is streamed to a file
+OUTPUT_TAIL_SIZE = 64 * 1024
+_STREAM_CHUNK_SIZE = 32 * 1024
+# Number of chunks of a streamed file that are requested ahead of writing them
+_STREAM_WINDOW = 32
+
+# Raised when opening a channel on a connection that was established but then broken
+_RESET_ERRORS = (ConnectionResetError, EOFError, paramiko.ssh_exception.SSHException)
+# Seconds to wait before asking again for a channel that the host refused
+_CHANNEL_RETRY_DELAY = 1
 
 
 class RemoteParamiko(object):
@@ -39,6 +51,8 @@ class RemoteParamiko(object):
         self.ssh_identity_file = ssh_identity_file
         self.host_variables = host_variables
         self.client = None
+        # Pooled connections are shared between threads, make sure only one of them connects
+        self._connect_lock = threading.Lock()
 
     def __enter__(self):
         return self
@@ -47,13 +61,17 @@ class RemoteParamiko(object):
         self.close()
 
     def _connect(self):
+        with self._connect_lock:
+            self._connect_locked()
+            return self.client
+
+    def _connect_locked(self):
         if self.client:
-            # Ensure underlying client is still a valid open connection
-            try:
-                stdin, stdout, stderr = self.client.exec_command(PING_COMMAND)
-            except (ConnectionResetError, paramiko.ssh_exception.SSHException):
-                # ConnectionResetError is raised when a connection was established but then broken
-                # paramiko.ssh_exception.SSHException is raised if the connection was known to be broken
+            # Ensure underlying client is still a valid open connection. The transport stops being active when the
+            # connection is closed or a keepalive could not be sent, so this needs no round-trip to the host.
+            transport = self.client.get_transport()
+            if transport is None or not transport.is_active():
+                self.client.close()
                 self.client = None
 
         if not self.client:
@@ -75,20 +93,51 @@ class RemoteParamiko(object):
                 self.client = None
                 raise BadSSHHost("Could not establish an SSH connection to host %s" % (self.hostname,))
 
-    def run_job(self, file, jobid, timeout=None, env={}):
-        try:
-            self._connect()
+    def _retry_on_reset(self, open_channel):
+        """Call open_channel with a connected client. If the connection turns out to have been reset, reconnect and
+        try once more. If the host refused the channel on a working connection, for example because sshd's
+        MaxSessions was reached, wait a little and try once more on the same connection.
 
-            transport = self.client.get_transport()
+        Only opening a channel is retried, never what is done with it afterwards, so commands are never sent twice."""
+        client = self._connect()
+        try:
+            return open_channel(client)
+        except _RESET_ERRORS as e:
+            transport = client.get_transport()
+            if transport is not None and transport.is_active():
+                # Other threads may be using this connection, leave it open
+                debug("Host %s refused a channel, retrying:" % (self.hostname,), e)
+                time.sleep(_CHANNEL_RETRY_DELAY)
+                return open_channel(client)
+            debug("Connection to %s was reset, reconnecting" % (self.hostname,))
+            with self._connect_lock:
+                if self.client is client:
+                    client.close()
+                    self.client = None
+            return open_channel(self._connect())
+
+    def _exec(self, cmd, timeout=None):
+        """Like SSHClient.exec_command, but reconnects if the connection was reset"""
+        channel = self._retry_on_reset(lambda client: client.get_transport().open_session(timeout=timeout))
+        channel.settimeout(timeout)
+        channel.exec_command(cmd)
+        return channel.makefile_stdin('wb'), channel.makefile('r'), channel.makefile_stderr('r')
+
+    def _open_sftp(self):
+        return self._retry_on_reset(lambda client: client.open_sftp())
+
+    def run_job(self, file, jobid, timeout=None, env={}, output_directory=None):
+        """Run the script in file on the host and return its result.
+
+        If output_directory is given, stdout and stderr of the job are streamed to the files out and err in it, and
+        only the last OUTPUT_TAIL_SIZE bytes of them are kept in the returned ExecutionResult."""
+        try:
+            transport = self._connect().get_transport()
             session = transport.open_session()
             paramiko.agent.AgentRequestHandler(session)
 
             dir = ".cstar/remote-jobs/" + jobid
 
-            self.run(("mkdir", "-p", dir))
-
-            self.put_command(file, "%s/job" % (dir,))
-
             # Manually insert environment into script, since passing env into exec_command leads to it being
             # ignored on most ssh servers. :-(
 
@@ -101,20 +150,35 @@ class RemoteParamiko(object):
 
             remote_script = resource_string('cstar.resources', 'scripts/remote_job.sh')
             wrapper = remote_script.decode("utf-8") % (env_str,)
-            self.write_command(wrapper, "%s/wrapper" % (dir,))
+            with open(file, 'rb') as f:
+                job = f.read()
 
             cmd = """
                 cd %s
                 nohup ./wrapper
                 """ % (self.escape(dir),)
 
-            stdin, stdout, stderr = self.client.exec_command(cmd, timeout=timeout)
-            _, _, _ = self._read_results(stdin, stdout, stderr, timeout)
-
-            real_output = self.read_file(dir + "/stdout")
-            real_error = self.read_file(dir + "/stderr")
-            real_status = int(self.read_file(dir + "/status"))
-            return ExecutionResult(cmd, real_status, real_output, real_error)
+            # Use the same SFTP session to upload the job and to fetch its results
+            with self._open_sftp() as ftp_client:
+                self._write_commands(ftp_client, dir, {"job": job, "wrapper": wrapper})
+
+                stdin, stdout, stderr = self._exec(cmd, timeout=timeout)
+                _, wrapper_output, _ = self._read_results(stdin, stdout, stderr,
+                                                          OutputTail(OUTPUT_TAIL_SIZE), OutputTail(OUTPUT_TAIL_SIZE))
+
+                # The wrapper reports the exit status of the job once it is done, only fall back to the status
+                # file if that report got lost
+                real_status = _finished_status(wrapper_output.getvalue())
+                if real_status is None:
+                    real_status, = self._read_files(ftp_client, (dir + "/status",))
+
+                if output_directory:
+                    real_output, real_error = self._stream_files(
+                        ftp_client, ((dir + "/stdout", output_directory + "/out"),
+                                     (dir + "/stderr", output_directory + "/err")))
+                else:
+                    real_output, real_error = self._read_files(ftp_client, (dir + "/stdout", dir + "/stderr"))
+            return ExecutionResult(cmd, int(real_status), real_output, real_error)
         except (ConnectionResetError, paramiko.ssh_exception.SSHException):
             raise BadSSHHost("SSH connection to host %s was reset" % (self.hostname,))
 
@@ -130,9 +194,8 @@ class RemoteParamiko(object):
 
     def run(self, argv):
         try:
-            self._connect()
             cmd = " ".join(self.escape(s) for s in argv)
-            stdin, stdout, stderr = self.client.exec_command(cmd)
+            stdin, stdout, stderr = self._exec(cmd)
             status, stdout_chunks, stderr_chunks = self._read_results(stdin, stdout, stderr)
             out = b''.join(stdout_chunks)
             error = b''.join(stderr_chunks)
@@ -147,7 +210,9 @@ class RemoteParamiko(object):
             self.client = None
             raise BadSSHHost("SSH connection to host %s was reset" % (self.hostname,))
 
-    def _read_results(self, stdin, stdout, stderr, timeout=30):
+    def _read_results(self, stdin, stdout, stderr, stdout_chunks=None, stderr_chunks=None):
+        """Read the output of a command until it exits. Chunks of output are appended to stdout_chunks and
+        stderr_chunks, pass an OutputTail to keep memory usage bounded."""
 
         # get the shared channel for stdout/stderr/stdin
         channel = stdout.channel
@@ -156,43 +221,41 @@ class RemoteParamiko(object):
         # indicate that we're not going to write to that channel anymore
         channel.shutdown_write()
 
-        # read stdout/stderr in order to prevent read block hangs
-        stdout_chunks, stderr_chunks = [], []
-        stdout_chunks.append(stdout.channel.recv(len(stdout.channel.in_buffer)))
-        # chunked read to prevent stalls
-        while not channel.closed or channel.recv_ready() or channel.recv_stderr_ready():
-            # stop if channel was closed prematurely, and there is no data in the buffers.
+        if stdout_chunks is None:
+            stdout_chunks = []
+        if stderr_chunks is None:
+            stderr_chunks = []
+
+        # Paramiko sets this event whenever data arrives on either buffer, and when the buffers are closed because
+        # the remote side sent EOF or the connection was lost. This lets the thread sleep until there is work.
+        ready = threading.Event()
+        channel.in_buffer.set_event(ready)
+        channel.in_stderr_buffer.set_event(ready)
+        while True:
+            ready.clear()
+            # Check for EOF before draining the buffers. The last chunk may arrive together with EOF while we drain,
+            # it is then read on the next pass rather than lost.
+            eof = channel.eof_received or channel.closed
             got_chunk = False
-            readq, _, _ = select.select([stdout.channel], [], [], timeout)
-            for c in readq:
-                if c.recv_ready():
-                    stdout_chunks.append(stdout.channel.recv(len(c.in_buffer)))
-                    got_chunk = True
-                if c.recv_stderr_ready():
-                    # make sure to read stderr to prevent stall
-                    stderr_chunks.append(stderr.channel.recv_stderr(len(c.in_stderr_buffer)))
-                    got_chunk = True
-            '''
-            1) make sure that there are at least 2 cycles with no data in the input buffers in order to not exit too early (i.e. cat on a >200k file).
-            2) if no data arrived in the last loop, check if we already received the exit code
-            3) check if input buffers are empty
-            4) exit the loop
-            '''
-            if not got_chunk \
-                    and stdout.channel.exit_status_ready() \
-                    and not stderr.channel.recv_stderr_ready() \
-                    and not stdout.channel.recv_ready():
-                # indicate that we're not going to read from this channel anymore
-                stdout.channel.shutdown_read()
-                # close the channel
-                stdout.channel.close()
-                break    # exit as remote side is finished and our bufferes are empty
+            if channel.recv_ready():
+                stdout_chunks.append(channel.recv(len(channel.in_buffer)))
+                got_chunk = True
+            if channel.recv_stderr_ready():
+                stderr_chunks.append(channel.recv_stderr(len(channel.in_stderr_buffer)))
+                got_chunk = True
+            if got_chunk:
+                continue
+            if eof:
+                # Both buffers were found empty after EOF, nothing more can arrive
+                break
+            ready.wait()
 
         # close all the pseudofiles
         stdout.close()
         stderr.close()
 
-        status = stdout.channel.recv_exit_status()
+        status = channel.recv_exit_status()
+        channel.close()
         return status, stdout_chunks, stderr_chunks
 
     @staticmethod
@@ -202,28 +265,79 @@ class RemoteParamiko(object):
         return input
 
     def read_file(self, remotepath):
-        self._connect()
-        with self.client.open_sftp() as ftp_client:
+        return self.read_files((remotepath,))[0]
+
+    def read_files(self, remotepaths):
+        """Read several remote files in a single SFTP session"""
+        with self._open_sftp() as ftp_client:
+            return self._read_files(ftp_client, remotepaths)
+
+    @staticmethod
+    def _read_files(ftp_client, remotepaths):
+        files = [ftp_client.file(remotepath, 'r') for remotepath in remotepaths]
+        try:
+            for f in files:
+                f.prefetch()
+            return [str(f.read(), 'utf-8') for f in files]
+        finally:
+            for f in files:
+                f.close()
+
+    @staticmethod
+    def _stream_files(ftp_client, paths):
+        """Copy several remote files to local files in a single SFTP session, one file after the other. Returns the
+        tail of each file."""
+        tails = []
+        for remotepath, localpath in paths:
             with ftp_client.file(remotepath, 'r') as f:
-                return str(f.read(), 'utf-8')
+                tail = RemoteParamiko._stream_file(f, localpath)
+            text = str(tail.getvalue(), 'utf-8', 'replace')
+            if tail.truncated:
+                text = "[output truncated, see %s for all of it]\n%s" % (localpath, text)
+            tails.append(text)
+        return tails
+
+    @staticmethod
+    def _stream_file(f, localpath):
+        # Not prefetch(), which requests the whole file at once and buffers it in memory. Request a window of
+        # _STREAM_WINDOW chunks at a time instead, which keeps the link busy with bounded memory.
+        size = f.stat().st_size
+        tail = OutputTail(OUTPUT_TAIL_SIZE)
+        with open(localpath, 'wb') as local:
+            offset = 0
+            while offset < size:
+                window_end = min(size, offset + _STREAM_CHUNK_SIZE * _STREAM_WINDOW)
+                chunks = [(start, min(_STREAM_CHUNK_SIZE, window_end - start))
+                          for start in range(offset, window_end, _STREAM_CHUNK_SIZE)]
+                for chunk in f.readv(chunks):
+                    local.write(chunk)
+                    tail.append(chunk)
+                offset = window_end
+        return tail
 
     def put_file(self, localpath, remotepath):
-        self._connect()
-        with self.client.open_sftp() as ftp_client:
+        with self._open_sftp() as ftp_client:
             ftp_client.put(localpath, remotepath)
 
     def put_command(self, localpath, remotepath):
-        self._connect()
-        with self.client.open_sftp() as ftp_client:
+        with self._open_sftp() as ftp_client:
             ftp_client.put(localpath, remotepath)
             ftp_client.chmod(remotepath, 0o755)
 
     def write_command(self, definition, remotepath):
-        self._connect()
-        with self.client.open_sftp() as ftp_client:
+        with self._open_sftp() as ftp_client:
+            self._write_commands(ftp_client, None, {remotepath: definition})
+
+    @staticmethod
+    def _write_commands(ftp_client, directory, definitions):
+        if directory:
+            _sftp_makedirs(ftp_client, directory)
+        for name, definition in definitions.items():
+            remotepath = directory + "/" + name if directory else name
             with ftp_client.open(remotepath, 'w') as f:
+                f.set_pipelined(True)
                 f.write(definition)
-            ftp_client.chmod(remotepath, 0o755)
+                f.chmod(0o755)
 
     def mkdir(self, path):
         self.run("mkdir " + path)
@@ -232,3 +346,28 @@ class RemoteParamiko(object):
         if self.client:
             self.client.close()
         self.client = None
+
+
+def _finished_status(wrapper_output):
+    """Return the exit status reported by remote_job.sh in its output, or None if it is missing"""
+    match = _finished_re.search(wrapper_output)
+    return int(match.group(1)) if match else None
+
+
+def _sftp_makedirs(ftp_client, path):
+    """The SFTP equivalent of mkdir -p"""
+    try:
+        ftp_client.stat(path)
+        return
+    except IOError:
+        pass
+    parts = path.split("/")
+    for i in range(1, len(parts) + 1):
+        partial = "/".join(parts[:i])
+        if not partial:
+            continue
+        try:
+            ftp_client.mkdir(partial)
+        except IOError:
+            # Most likely exists already, if not the upload will fail
+            pass
@@ -0,0 +1,153 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Forward and reverse DNS lookups, in bulk and cached between runs"""
+
+import concurrent.futures
+import json
+import os
+import socket
+import threading
+import time
+
+from cstar.output import debug, warn
+
+CACHE_FORMAT_VERSION = 1
+# The system resolver does not tell us the TTL of records, so cache answers for a fixed time
+DEFAULT_TTL = 3600
+# Hosts without a reverse record are asked again sooner
+DEFAULT_NEGATIVE_TTL = 300
+DEFAULT_MAX_WORKERS = 32
+
+
+class Resolver(object):
+    """Resolves names to addresses and addresses to names.
+
+    Answers are cached for ttl seconds, failed reverse lookups for negative_ttl seconds. If cache_file is given, the
+    cache is loaded from it and written back by save(). Bulk lookups use at most max_workers threads."""
+
+    def __init__(self, cache_file=None, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 max_workers=DEFAULT_MAX_WORKERS, clock=time.time,
+                 gethostbyname=socket.gethostbyname, gethostbyaddr=socket.gethostbyaddr):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_workers = max_workers
+        self._clock = clock
+        self._gethostbyname = gethostbyname
+        self._gethostbyaddr = gethostbyaddr
+        self._lock = threading.Lock()
+        self._forward = {}
+        self._reverse = {}
+        self._dirty = False
+        if cache_file:
+            self._load()
+
+    def lookup(self, name):
+        """Return the address of name. Raises socket.gaierror like socket.gethostbyname if it does not resolve."""
+        found, address = self._cached(self._forward, name)
+        if found:
+            return address
+        address = self._gethostbyname(name)
+        self._store(self._forward, name, address, self.ttl)
+        return address
+
+    def lookup_all(self, names):
+        """Resolve all names concurrently and return a dict from name to address. Raises if any name does not
+        resolve."""
+        return self._bulk(self._forward, names, self.lookup)
+
+    def reverse_lookup(self, address):
+        """Return the host name of address, or None if it has none"""
+        found, name = self._cached(self._reverse, address)
+        if found:
+            return name
+        try:
+            name = self._gethostbyaddr(address)[0]
+        except (socket.herror, socket.gaierror):
+            self._store(self._reverse, address, None, self.negative_ttl)
+            return None
+        self._store(self._reverse, address, name, self.ttl)
+        return name
+
+    def reverse_lookup_all(self, addresses):
+        """Look up the host names of all addresses concurrently and return a dict from address to host name.
+        Addresses without a name are left out."""
+        names = self._bulk(self._reverse, addresses, self.reverse_lookup)
+        return dict((address, name) for address, name in names.items() if name)
+
+    def _bulk(self, cache, keys, lookup):
+        result = {}
+        missing = []
+        for key in set(keys):
+            found, value = self._cached(cache, key)
+            if found:
+                result[key] = value
+            else:
+                missing.append(key)
+        if not missing:
+            return result
+
+        debug("Resolving %d addresses" % (len(missing),))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+            futures = dict((executor.submit(lookup, key), key) for key in missing)
+            for future in concurrent.futures.as_completed(futures):
+                result[futures[future]] = future.result()
+        return result
+
+    def _cached(self, cache, key):
+        with self._lock:
+            entry = cache.get(key)
+        if entry is None or entry[1] < self._clock():
+            return False, None
+        return True, entry[0]
+
+    def _store(self, cache, key, value, ttl):
+        with self._lock:
+            cache[key] = (value, self._clock() + ttl)
+            self._dirty = True
+
+    def _load(self):
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file) as f:
+                data = json.load(f)
+            if data.get("version") != CACHE_FORMAT_VERSION:
+                return
+            now = self._clock()
+            for cache, key in ((self._forward, "forward"), (self._reverse, "reverse")):
+                for name, (value, expires) in data[key].items():
+                    if expires >= now:
+                        cache[name] = (value, expires)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            warn("Ignoring unreadable DNS cache %s:" % (self.cache_file,), e)
+
+    def save(self):
+        """Write the unexpired cache entries to cache_file, if anything was resolved since it was loaded"""
+        if not self.cache_file or not self._dirty:
+            return
+        now = self._clock()
+        with self._lock:
+            data = {"version": CACHE_FORMAT_VERSION}
+            for cache, key in ((self._forward, "forward"), (self._reverse, "reverse")):
+                data[key] = dict((name, entry) for name, entry in cache.items() if entry[1] >= now)
+            self._dirty = False
+        tmp_file = "%s.%d.tmp" % (self.cache_file, os.getpid())
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            warn("Could not save DNS cache %s:" % (self.cache_file,), e)
@@ -1,14 +1,44 @@
 #! /bin/sh
 
+# The first wrapper holds an exclusive lock on the lock file for as long as the job runs. A wrapper started
+# to resume the job blocks on that lock, so it returns as soon as the job is finished.
+
+finished() {
+    echo "cstar-job-finished $(cat status)"
+}
+
 if test -f pid; then
-    # We can't wait for things that aren't our children. Loop and sleep. :-(
+    if ! test -f status && command -v flock >/dev/null 2>&1; then
+        flock lock true
+    fi
+    # No flock, or the first wrapper died without recording a status. Wait for the status file to appear.
+    delay=1
     while ! test -f status; do
-        sleep 10s
+        if command -v inotifywait >/dev/null 2>&1; then
+            inotifywait -qq -t 10 -e create -e moved_to . >/dev/null 2>&1
+            # Exit status 1 means inotifywait could not watch the directory, don't spin
+            if test $? -eq 1; then
+                sleep 1
+            fi
+        else
+            sleep $delay
+            if test $delay -lt 8; then
+                delay=$((delay * 2))
+            fi
+        fi
     done
+    finished
     exit
 fi
 
-%s ./job >stdout 2>stderr &
+exec 9>lock
+if command -v flock >/dev/null 2>&1; then
+    flock 9
+fi
+
+%s ./job >stdout 2>stderr 9>&- &
 echo $! >pid
 wait $!
-echo $? >status
\ No newline at end of file
+echo $? >status.tmp
+mv status.tmp status
+finished
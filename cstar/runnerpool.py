@@ -0,0 +1,79 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A bounded pool of threads for job runners"""
+
+import concurrent.futures
+import threading
+import time
+
+from cstar.output import warn
+
+# Maximum number of job runners executing at the same time
+DEFAULT_MAX_WORKERS = 64
+
+
+class RateLimiter(object):
+    """Spaces out the callers of wait() so that they return at least interval seconds apart"""
+
+    def __init__(self, interval, clock=time.monotonic, sleep=time.sleep):
+        self.interval = interval
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next = None
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = self._clock()
+            start = now if self._next is None else max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            self._sleep(start - now)
+
+
+class RunnerPool(object):
+    """Runs job runners on at most max_workers threads.
+
+    Runners submitted while every worker is busy wait in a queue, so scheduling never blocks. Each runner waits until
+    at least interval seconds have passed since the previous one started before it runs, which keeps cstar from
+    opening SSH connections faster than sshd accepts them."""
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, interval=0, clock=time.monotonic, sleep=time.sleep):
+        self.max_workers = max_workers
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                              thread_name_prefix="cstar runner")
+        self._limiter = RateLimiter(interval, clock, sleep)
+
+    def submit(self, runner, host=None):
+        """Queue runner to be run, and return its future"""
+        future = self.executor.submit(self.run, runner)
+        future.add_done_callback(lambda f: self._report(f, host))
+        return future
+
+    def run(self, runner):
+        """Run runner in the calling thread once the rate limit allows it"""
+        self._limiter.wait()
+        return runner()
+
+    @staticmethod
+    def _report(future, host):
+        # Exceptions from threads used to be printed, don't lose them now that futures hold them
+        if not future.cancelled() and future.exception():
+            warn("Job runner for host %s failed:" % (host.fqdn if host else "?",), future.exception())
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
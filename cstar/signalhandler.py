@@ -24,6 +24,7 @@ _job = None
 
 def _handler(signum, frame):
     if cstar.jobwriter.write(_job):
+        cstar.jobwriter.close(_job)
         print("\n" + _msg)
     sys.exit(1)
 
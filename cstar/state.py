@@ -44,35 +44,66 @@ class State(object):
         self.progress = progress or cstar.progress.Progress()
         self.stop_after = stop_after
         self.ignore_down_nodes = ignore_down_nodes
+        self._scheduler = None
 
     def clone(self):
-        return copy.copy(self)
+        res = copy.copy(self)
+        # Every state owns its scheduler, so that updating it does not change the state it was cloned from
+        if self._scheduler:
+            res._scheduler = self._scheduler.copy()
+        return res
 
     def with_topology(self, new_topology):
         res = self.clone()
         res.current_topology = new_topology
         return res
 
+    def with_endpoint_mapping(self, endpoint_mapping):
+        res = self.clone()
+        res.endpoint_mapping = endpoint_mapping
+        # The scheduler was built from the old mapping
+        res._scheduler = None
+        return res
+
     def with_running(self, host):
-        return self.with_progress(self.progress.with_running(host))
+        res = self.with_progress(self.progress.with_running(host))
+        if res._scheduler:
+            res._scheduler.mark_running(host)
+        return res
 
     def with_done(self, host):
-        return self.with_progress(self.progress.with_done(host))
+        res = self.with_progress(self.progress.with_done(host))
+        if res._scheduler:
+            res._scheduler.mark_done(host)
+        return res
 
     def with_failed(self, host):
-        return self.with_progress(self.progress.with_failed(host))
+        res = self.with_progress(self.progress.with_failed(host))
+        if res._scheduler:
+            res._scheduler.mark_failed(host)
+        return res
 
     def with_progress(self, progress):
         res = self.clone()
         res.progress = progress
         return res
 
+    def _get_scheduler(self):
+        if self._scheduler is None:
+            self._scheduler = cstar.strategy.Scheduler(
+                topology=self.original_topology, strategy=self.strategy, endpoint_mapping=self.endpoint_mapping,
+                max_concurrency=self.max_concurrency, progress=self.progress,
+                cluster_parallel=self.cluster_parallel, dc_parallel=self.dc_parallel, stop_after=self.stop_after,
+                ignore_down_nodes=self.ignore_down_nodes)
+        else:
+            self._scheduler.sync(self.progress)
+        return self._scheduler
+
     def find_next_host(self):
-        return cstar.strategy.find_next_host(
-            topology=self.original_topology, strategy=self.strategy, endpoint_mapping=self.endpoint_mapping,
-            max_concurrency=self.max_concurrency, progress=self.progress,
-            cluster_parallel=self.cluster_parallel, dc_parallel=self.dc_parallel, stop_after=self.stop_after,
-            ignore_down_nodes=self.ignore_down_nodes)
+        return self._get_scheduler().next_host()
+
+    def expected_waves(self):
+        return self._get_scheduler().expected_waves()
 
     def is_done(self):
         return (len(self.progress.done) == len(self.original_topology)) or (
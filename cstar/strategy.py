@@ -12,8 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import copy
+import heapq
 from enum import Enum
+
+import cstar.progress
 from cstar.exceptions import HostIsDown
+from cstar.topology import Datacenter
 
 
 class Strategy(Enum):
@@ -41,51 +47,228 @@ def serialize(s):
     }[s]
 
 
+def color_conflict_graph(topology, endpoint_mapping):
+    """Split the hosts of a topology into waves of hosts that share no replicas.
+
+    The replica conflict graph is colored greedily. Hosts are visited rack by rack, largest rack first, and by
+    decreasing number of neighbours within a rack. Since replicas are normally placed on distinct racks, this tends
+    to put a whole rack in the same wave, which gives few and large waves.
+
+    Returns a dict mapping each host to its wave number."""
+    neighbours = dict((host, set()) for host in topology)
+    for host, friends in (endpoint_mapping or {}).items():
+        if host not in neighbours:
+            continue
+        for friend in friends:
+            if friend in neighbours and friend != host:
+                neighbours[host].add(friend)
+                neighbours[friend].add(host)
+
+    rack_sizes = collections.Counter((host.cluster, host.dc, host.rack) for host in topology)
+    order = sorted(topology, key=lambda host: (-rack_sizes[(host.cluster, host.dc, host.rack)], host.rack,
+                                               -len(neighbours[host]), host.ip))
+    waves = {}
+    for host in order:
+        taken = set(waves[friend] for friend in neighbours[host] if friend in waves)
+        wave = 0
+        while wave in taken:
+            wave += 1
+        waves[host] = wave
+    return waves
+
+
 def find_next_host(strategy, topology, endpoint_mapping, progress, cluster_parallel, dc_parallel, max_concurrency,
                    stop_after, ignore_down_nodes):
     """Entry point for figuring out which host to do things on next."""
+    scheduler = Scheduler(strategy, topology, endpoint_mapping, cluster_parallel, dc_parallel, max_concurrency,
+                          stop_after, ignore_down_nodes, progress)
+    return scheduler.next_host()
 
-    if stop_after and ((len(progress.running) + len(progress.done) + len(progress.failed)) >= stop_after):
-        return None
 
-    remaining = topology.without_hosts(progress.done).without_hosts(progress.running).without_hosts(progress.failed)
-    if progress.running and not cluster_parallel:
-        remaining = remaining.with_cluster(next(iter(progress.running)).cluster)
+class Scheduler(object):
+    """Incrementally keeps track of the hosts that are left to run on.
 
-    if progress.running and not dc_parallel:
-        remaining = remaining.with_dc_or_distinct_cluster(progress.running)
+    Remaining hosts are kept in one priority queue per data center, and the number of running hosts per data center
+    and cluster as well as the number of running replica neighbours of every host are updated on each transition.
+    Finding the next host only has to look at the head of each data center queue instead of filtering and sorting
+    the whole topology."""
 
-    if not remaining:
-        return None
+    def __init__(self, strategy, topology, endpoint_mapping, cluster_parallel, dc_parallel, max_concurrency,
+                 stop_after, ignore_down_nodes, progress=None):
+        self.strategy = strategy
+        self.topology = topology
+        self.endpoint_mapping = endpoint_mapping
+        self.cluster_parallel = cluster_parallel
+        self.dc_parallel = dc_parallel
+        self.max_concurrency = max_concurrency
+        self.stop_after = stop_after
+        self.ignore_down_nodes = ignore_down_nodes
+        self._waves = color_conflict_graph(topology, endpoint_mapping) if strategy is Strategy.TOPOLOGY else {}
+        self.reset(progress or cstar.progress.Progress())
 
-    if max_concurrency and (len(progress.running) >= max_concurrency):
-        return None
+    def reset(self, progress):
+        """Rebuild the scheduler state from scratch for the given progress"""
+        self._running = set()
+        self._done = set()
+        self._failed = set()
+        self._remaining = set(self.topology)
+        self._queues = {}
+        self._remaining_per_dc = collections.Counter()
+        self._down_per_dc = {}
+        self._running_per_dc = collections.Counter()
+        self._running_per_cluster = collections.Counter()
+        self._blocked = collections.Counter()
 
-    if not ignore_down_nodes:
-        for host in remaining:
+        for host in self._remaining:
+            dc = _datacenter(host)
+            self._queues.setdefault(dc, []).append((self._priority(host), host))
+            self._remaining_per_dc[dc] += 1
             if not host.is_up:
-                raise HostIsDown(host)
+                self._down_per_dc.setdefault(dc, set()).add(host)
+        for queue in self._queues.values():
+            heapq.heapify(queue)
+
+        for host in progress.done:
+            self.mark_done(host)
+        for host in progress.failed:
+            self.mark_failed(host)
+        for host in progress.running:
+            self.mark_running(host)
+
+    def copy(self):
+        """Return a scheduler with the same state that can be updated without affecting this one"""
+        res = copy.copy(self)
+        res._running = set(self._running)
+        res._done = set(self._done)
+        res._failed = set(self._failed)
+        res._remaining = set(self._remaining)
+        res._queues = dict((dc, list(queue)) for dc, queue in self._queues.items())
+        res._remaining_per_dc = collections.Counter(self._remaining_per_dc)
+        res._down_per_dc = dict((dc, set(down)) for dc, down in self._down_per_dc.items())
+        res._running_per_dc = collections.Counter(self._running_per_dc)
+        res._running_per_cluster = collections.Counter(self._running_per_cluster)
+        res._blocked = collections.Counter(self._blocked)
+        return res
+
+    def sync(self, progress):
+        """Make sure the scheduler reflects progress, rebuilding it if the progress was changed behind its back"""
+        if progress.running != self._running or progress.done != self._done or progress.failed != self._failed:
+            self.reset(progress)
+
+    def _priority(self, host):
+        return self._waves.get(host, 0), host.rack, host.ip
+
+    def expected_waves(self):
+        """Estimate how many rounds of execution are needed to run on all remaining hosts"""
+        if not self._remaining:
+            return 0
+        waves_per_dc = {}
+        for host in self._remaining:
+            waves_per_dc.setdefault(_datacenter(host), set()).add(self._waves.get(host, 0))
+
+        waves_per_cluster = {}
+        for dc, waves in waves_per_dc.items():
+            combine = max if self.dc_parallel else sum
+            waves_per_cluster[dc.cluster] = combine((waves_per_cluster.get(dc.cluster, 0), len(waves)))
+        combine = max if self.cluster_parallel else sum
+        res = combine(waves_per_cluster.values())
+
+        if self.max_concurrency:
+            res = max(res, -(-len(self._remaining) // self.max_concurrency))
+        return res
+
+    def _take(self, host):
+        if host not in self._remaining:
+            return
+        self._remaining.remove(host)
+        dc = _datacenter(host)
+        self._remaining_per_dc[dc] -= 1
+        down = self._down_per_dc.get(dc)
+        if down:
+            down.discard(host)
+
+    def mark_running(self, host):
+        if host in self._running:
+            return
+        self._take(host)
+        self._running.add(host)
+        self._running_per_dc[_datacenter(host)] += 1
+        self._running_per_cluster[host.cluster] += 1
+        if self.strategy is Strategy.TOPOLOGY:
+            for neighbour in self.endpoint_mapping.get(host, ()):
+                self._blocked[neighbour] += 1
+
+    def mark_done(self, host):
+        self._finish(host)
+        self._done.add(host)
+
+    def mark_failed(self, host):
+        self._finish(host)
+        self._failed.add(host)
+
+    def _finish(self, host):
+        if host not in self._running:
+            self._take(host)
+            return
+        self._running.remove(host)
+        self._running_per_dc[_datacenter(host)] -= 1
+        self._running_per_cluster[host.cluster] -= 1
+        if self.strategy is Strategy.TOPOLOGY:
+            for neighbour in self.endpoint_mapping.get(host, ()):
+                self._blocked[neighbour] -= 1
+                if not self._blocked[neighbour] and neighbour in self._remaining:
+                    # Blocked hosts are dropped from the queues when they are encountered, so put it back
+                    neighbour = self.topology.get_host(neighbour)
+                    heapq.heappush(self._queues[_datacenter(neighbour)], (self._priority(neighbour), neighbour))
+
+    def _peek(self, dc):
+        """Return the highest priority host of a data center that can be run on, dropping stale queue entries"""
+        queue = self._queues[dc]
+        while queue:
+            host = queue[0][1]
+            if host in self._remaining and not self._blocked[host]:
+                return queue[0]
+            heapq.heappop(queue)
+        return None
 
-    return _strategy_mapping[strategy](remaining, endpoint_mapping, progress.running)
+    def next_host(self):
+        running = self._running
+        if self.stop_after and ((len(running) + len(self._done) + len(self._failed)) >= self.stop_after):
+            return None
 
+        candidates = []
+        for dc, count in self._remaining_per_dc.items():
+            if not count:
+                continue
+            if running and not self.cluster_parallel and not self._running_per_cluster[dc.cluster]:
+                continue
+            if running and not self.dc_parallel and self._running_per_cluster[dc.cluster] \
+                    and not self._running_per_dc[dc]:
+                continue
+            candidates.append(dc)
 
-def _all_find_next_host(remaining, endpoint_mapping, running):
-    return remaining.first()
+        if not candidates:
+            return None
 
+        if self.max_concurrency and (len(running) >= self.max_concurrency):
+            return None
 
-def _one_find_next_host(remaining, endpoint_mapping, running):
-    remaining = remaining.without_dcs(remaining.get_dcs(running))
-    return remaining.first()
+        if not self.ignore_down_nodes:
+            for dc in candidates:
+                down = self._down_per_dc.get(dc)
+                if down:
+                    raise HostIsDown(next(iter(down)))
 
+        if self.strategy is Strategy.ONE:
+            candidates = [dc for dc in candidates if not self._running_per_dc[dc]]
 
-def _topology_find_next_host(remaining, endpoint_mapping, running):
-    for h in running:
-        for next in endpoint_mapping[h]:
-            remaining = remaining.without_host(next)
-    return remaining.first()
+        best = None
+        for dc in candidates:
+            head = self._peek(dc)
+            if head and (best is None or head[0] < best[0]):
+                best = head
+        return best[1] if best else None
 
 
-_strategy_mapping = {
-    Strategy.ONE: _one_find_next_host,
-    Strategy.TOPOLOGY: _topology_find_next_host,
-    Strategy.ALL: _all_find_next_host}
+def _datacenter(host):
+    return Datacenter(host.cluster, host.dc)
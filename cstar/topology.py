@@ -31,82 +31,146 @@ def _host_eq(self, other):
 Host.__eq__ = _host_eq
 
 
+class _Index(object):
+    """Buckets of the hosts of a topology, computed in a single pass.
+
+    All buckets are frozensets so that sub-topologies can be created from them directly, without copying or
+    filtering the host set again."""
+
+    def __init__(self, hosts):
+        by_cluster = {}
+        by_dc = {}
+        by_rack = {}
+        up = []
+        down = []
+        for host in hosts:
+            by_cluster.setdefault(host.cluster, []).append(host)
+            by_dc.setdefault(Datacenter(host.cluster, host.dc), []).append(host)
+            by_rack.setdefault(host.rack, []).append(host)
+            (up if host.is_up else down).append(host)
+        self.by_cluster = dict((key, frozenset(val)) for key, val in by_cluster.items())
+        self.by_dc = dict((key, frozenset(val)) for key, val in by_dc.items())
+        self.by_rack = dict((key, frozenset(val)) for key, val in by_rack.items())
+        self.up = frozenset(up)
+        self.down = frozenset(down)
+
+
 class Topology(object):
     """An immutable type describing a topology of C* clusters. Contains utility methods for creating filtered
     subtopologies.
 
+    Hosts are bucketed per cluster, per data center, per rack and per up/down state the first time a filter is
+    applied, and the filtered subtopologies are cached, so chaining the same filters repeatedly is cheap.
+
     This type is meant to be used without mutating it."""
 
     def __init__(self, hosts=[]):
-        self.hosts = set(hosts)
-        self.hosts_by_ip = {host.ip:host for host in self.hosts}
+        self.hosts = frozenset(hosts)
+        self._hosts_by_ip = None
+        self._index = None
+        self._first = None
+        self._derived = {}
+
+    @property
+    def hosts_by_ip(self):
+        if self._hosts_by_ip is None:
+            self._hosts_by_ip = {host.ip: host for host in self.hosts}
+        return self._hosts_by_ip
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = _Index(self.hosts)
+        return self._index
+
+    def _derive(self, key, make_hosts):
+        """Return the cached subtopology for key, creating it from make_hosts() on first use"""
+        res = self._derived.get(key)
+        if res is None:
+            hosts = make_hosts()
+            res = self if len(hosts) == len(self.hosts) else Topology(hosts)
+            self._derived[key] = res
+        return res
+
+    def _union(self, buckets):
+        return frozenset().union(*buckets)
 
     def first(self):
         """Return first host in topology (by cluster position)"""
         if not self:
             return None
-        return sorted(self.hosts, key=lambda x: x.rack)[0]
+        if self._first is None:
+            by_rack = self._get_index().by_rack
+            self._first = min(by_rack[min(by_rack)], key=lambda x: x.ip)
+        return self._first
 
     def get_host(self, ip):
-        for h in self:
-            if h.ip == ip:
-                return h
-        raise UnknownHost(ip)
+        host = self.hosts_by_ip.get(getattr(ip, "ip", ip))
+        if host is None:
+            raise UnknownHost(ip)
+        return host
 
     def with_cluster(self, cluster):
         """Return subtopology filtered on cluster"""
-        return Topology(filter(lambda host: cluster == host.cluster, self.hosts))
+        return self._derive(("cluster", cluster),
+                            lambda: self._get_index().by_cluster.get(cluster, frozenset()))
 
     def with_dc(self, cluster, dc):
         """Return subtopology filtered on pair cluster/dc for uniqness concerns"""
-        return Topology(filter(lambda host: dc == host.dc and cluster == host.cluster, self.hosts))
+        return self._derive(("dc", cluster, dc),
+                            lambda: self._get_index().by_dc.get(Datacenter(cluster, dc), frozenset()))
 
     def with_dc_or_distinct_cluster(self, hosts=None):
         """Return subtopology with DCs of passed hosts or DCs in a distinct cluster"""
-        all_dcs = self.get_dcs()
         running_dcs = self.get_dcs(hosts)
         clusters = set(cluster_dc.cluster for cluster_dc in running_dcs)
-        return Topology(filter(lambda host: Datacenter(host.cluster, host.dc) in running_dcs
-                                      or host.cluster not in clusters, self.hosts))
+        return Topology(self._union(
+            bucket for cluster_dc, bucket in self._get_index().by_dc.items()
+            if cluster_dc in running_dcs or cluster_dc.cluster not in clusters))
 
     def with_dc_filter(self, dc):
         """Retrun subtopology filtered on dc only dc is used,
            if clusters share a DC name, all clusters will be considered
            Prefer 'with_dc()' function"""
-        return Topology(filter(lambda host: dc == host.dc, self.hosts))
+        return self._derive(("dc_filter", dc), lambda: self._union(
+            bucket for cluster_dc, bucket in self._get_index().by_dc.items() if cluster_dc.dc == dc))
 
     def without_dcs(self, dcs):
         """Return subtopology with specific DCs filtered out"""
-        return Topology(filter(lambda host: Datacenter(host.cluster, host.dc) not in dcs, self.hosts))
+        return Topology(self._union(
+            bucket for cluster_dc, bucket in self._get_index().by_dc.items() if cluster_dc not in dcs))
 
     def without_host(self, host):
         """Return subtopology without specified host"""
-        return Topology(self.hosts - set((host,)))
+        return self.without_hosts((host,))
 
     def without_hosts(self, hosts):
         """Return subtopology without specified hosts"""
-        return Topology(self.hosts - set(hosts))
+        remaining = self.hosts.difference(hosts)
+        if len(remaining) == len(self.hosts):
+            return self
+        return Topology(remaining)
 
     def get_clusters(self):
         """Returns a set containing all the individual clusters in this topology"""
-        return set(host.cluster for host in self.hosts)
+        return set(self._get_index().by_cluster)
 
     def get_dcs(self, hosts=None):
         """Returns a set containing all the individual data centers for given hosts"""
-        subtopology = self if hosts is None else Topology(hosts)
-        return set(Datacenter(host.cluster,host.dc) for host in subtopology.hosts)
+        if hosts is None:
+            return set(self._get_index().by_dc)
+        return set(Datacenter(host.cluster, host.dc) for host in hosts)
 
     def get_down(self):
         """Returns a set of all nodes that are down in this topology"""
-        return Topology(node for node in self if not node.is_up)
+        return self._derive("down", lambda: self._get_index().down)
 
     def get_up(self):
         """Returns a set of all nodes that are up in this topology"""
-        return Topology(node for node in self if node.is_up)
-    
+        return self._derive("up", lambda: self._get_index().up)
+
     def get_hash(self):
         """Computes a hash for the current topology of the cluster"""
-        return hashlib.md5(next(iter(self.get_clusters())).encode('utf-8') + '-'.join(sorted(host.host_id for host in set(self.hosts))).encode('utf-8')).hexdigest()
+        return hashlib.md5(next(iter(self.get_clusters())).encode('utf-8') + '-'.join(sorted(host.host_id for host in self.hosts)).encode('utf-8')).hexdigest()
 
     def __contains__(self, o):
         return self.hosts.__contains__(o)
@@ -115,6 +179,8 @@ class Topology(object):
         return " ".join(host.fqdn for host in self.hosts)
 
     def __or__(self, other):
+        if not other.hosts or self.hosts.issuperset(other.hosts):
+            return self
         return Topology(self.hosts | other.hosts)
 
     def __len__(self):
@@ -124,7 +190,7 @@ class Topology(object):
         return iter(self.hosts)
 
     def __repr__(self):
-        return "Topology(%s)" % (self.hosts,)
+        return "Topology(%s)" % (set(self.hosts),)
 
     def __eq__(self, other):
         return self.hosts.__eq__(other.hosts)
@@ -0,0 +1,120 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import queue
+import threading
+import unittest
+
+from cstar.asyncengine import AsyncEngine
+from cstar.executionresult import ExecutionResult
+from cstar.topology import Host
+
+
+class FakeProgress(object):
+    def __init__(self):
+        self.running = set()
+
+
+class FakeState(object):
+    def __init__(self, hosts, max_concurrency):
+        self.pending = list(hosts)
+        self.progress = FakeProgress()
+        self.max_concurrency = max_concurrency
+        self.done = []
+
+    def is_done(self):
+        return not self.pending and not self.progress.running
+
+
+class FakeJob(object):
+    """Implements the parts of cstar.job.Job that the engine drives"""
+
+    def __init__(self, hosts, max_concurrency, fail=()):
+        self.state = FakeState(hosts, max_concurrency)
+        self.results = queue.Queue()
+        self.timeout = 10
+        self.sleep_on_new_runner = 0
+        self.do_loop = False
+        self.fail = fail
+        self.max_running = 0
+        self.topology_checks = 0
+        self.lock = threading.Lock()
+        self.begun = False
+        self.ended = False
+
+    def begin_run(self):
+        self.begun = True
+        self.do_loop = True
+
+    def end_run(self):
+        self.ended = True
+
+    def runnable_hosts(self):
+        while self.state.pending and len(self.state.progress.running) < self.state.max_concurrency:
+            host = self.state.pending.pop(0)
+            self.state.progress.running.add(host)
+            self.max_running = max(self.max_running, len(self.state.progress.running))
+            yield host
+
+    def new_runner(self, host):
+        def run():
+            status = 1 if host in self.fail else 0
+            self.results.put((host, ExecutionResult("true", status, "", "")))
+        return run
+
+    def handle_finished_jobs(self, finished_jobs):
+        for host, result in finished_jobs:
+            self.state.progress.running.remove(host)
+            self.state.done.append(host)
+            if result.status != 0:
+                self.do_loop = False
+
+    def check_nodes_returned(self, nodes):
+        self.topology_checks += 1
+        return True
+
+
+def make_hosts(count):
+    return [Host("host%d" % (i,), "1.2.3.%d" % (i,), "eu", "cluster1", "r1", True, i) for i in range(count)]
+
+
+class AsyncEngineTest(unittest.TestCase):
+
+    def test_runs_every_host(self):
+        hosts = make_hosts(10)
+        job = FakeJob(hosts, max_concurrency=3)
+        AsyncEngine(job, max_workers=2).run()
+        self.assertTrue(job.begun)
+        self.assertTrue(job.ended)
+        self.assertEqual(set(hosts), set(job.state.done))
+        self.assertLessEqual(job.max_running, 3)
+        self.assertGreater(job.topology_checks, 0)
+
+    def test_stops_on_failure(self):
+        hosts = make_hosts(10)
+        job = FakeJob(hosts, max_concurrency=1, fail=(hosts[2],))
+        AsyncEngine(job).run()
+        self.assertEqual(hosts[:3], job.state.done)
+        self.assertTrue(job.ended)
+
+    def test_resumes_running_hosts(self):
+        hosts = make_hosts(3)
+        job = FakeJob(hosts[1:], max_concurrency=1)
+        job.state.progress.running.add(hosts[0])
+        AsyncEngine(job).run(resume_hosts=[hosts[0]])
+        self.assertEqual(hosts, job.state.done)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cstar.cache import EndpointMappingCache, cache_key
+from cstar.topology import Host, Topology
+from tests.fakes import FakeClock
+
+
+def make_host(name, ip, is_up=True):
+    return Host(name, ip, "eu", "cluster1", "r1", is_up, "id-" + name)
+
+
+A = make_host("a", "1.1.1.1")
+B = make_host("b", "1.1.1.2")
+C = make_host("c", "1.1.1.3")
+MAPPING = {A: {B, C}, B: {A}, C: set()}
+
+
+class EndpointMappingCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = FakeClock(1000000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_cache(self, **kwargs):
+        return EndpointMappingCache(self.directory, clock=self.clock, **kwargs)
+
+    def test_cache_key(self):
+        key = cache_key(["v2", "v1"], ["h1", "h2"])
+        self.assertEqual(64, len(key))
+        self.assertEqual(key, cache_key(["v1", "v2"], ["h2", "h1"]))
+        self.assertNotEqual(key, cache_key(["v1"], ["h1", "h2"]))
+
+    def test_roundtrip(self):
+        cache = self.make_cache()
+        self.assertIsNone(cache.get("key"))
+        cache.put("key", MAPPING)
+        loaded = cache.get("key")
+        self.assertEqual(MAPPING, loaded)
+        self.assertEqual(set(MAPPING), set(loaded))
+        self.assertEqual("id-a", next(host for host in loaded if host == A).host_id)
+
+    def test_prefers_topology_hosts(self):
+        cache = self.make_cache()
+        cache.put("key", MAPPING)
+        down_b = make_host("b", "1.1.1.2", is_up=False)
+        loaded = cache.get("key", Topology((A, down_b, C)))
+        self.assertFalse(next(iter(loaded[A] - {C})).is_up)
+
+    def test_unreadable_file_is_a_miss(self):
+        cache = self.make_cache()
+        cache.put("key", MAPPING)
+        [name] = os.listdir(self.directory)
+        with open(os.path.join(self.directory, name), "w") as f:
+            f.write("{garbage")
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_eviction(self):
+        with open(os.path.join(self.directory, "endpoint_mapping-v1-h1"), "wb") as f:
+            f.write(b"old pickle")
+        cache = self.make_cache(max_entries=2, max_age=100)
+        cache.put("old", MAPPING)
+        self.clock.now += 101
+        cache.put("k1", MAPPING)
+        self.assertIsNone(cache.get("old"))
+        self.clock.now += 1
+        cache.put("k2", MAPPING)
+        self.clock.now += 1
+        cache.get("k1")
+        self.clock.now += 1
+        cache.put("k3", MAPPING)
+        self.assertEqual(2, len(os.listdir(self.directory)))
+        self.assertIsNotNone(cache.get("k1"))
+        self.assertIsNone(cache.get("k2"))
+        self.assertIsNotNone(cache.get("k3"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,10 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
 import unittest
 import os.path
 
 import cstar.cleanup
+import cstar.jobwriter
 
 
 class CleanupTest(unittest.TestCase):
@@ -40,3 +42,26 @@ class CleanupTest(unittest.TestCase):
     def test_delete_a_directory(self):
         cstar.cleanup.cleanup(7, listdir=lambda x: ['12345'], jobread=self.raise_exc, delete=self.delete)
         self.assertEqual(self.deleted, [os.path.join(os.path.expanduser('~/.cstar/jobs'), '12345')])
+
+    def test_metadata_is_used_instead_of_job_file(self):
+        now = time.time()
+        metadata = {
+            "new": {"file_format_version": cstar.jobwriter.FILE_FORMAT_VERSION, "creation_timestamp": now},
+            "old": {"file_format_version": cstar.jobwriter.FILE_FORMAT_VERSION, "creation_timestamp": now - 9 * 86400},
+            "unreadable": {"file_format_version": 1, "creation_timestamp": now},
+        }
+        cstar.cleanup.cleanup(7, listdir=lambda x: sorted(metadata), jobread=self.raise_exc, delete=self.delete,
+                              read_metadata=lambda path: metadata[os.path.basename(path)])
+        self.assertEqual([os.path.basename(path) for path in self.deleted], ["old", "unreadable"])
+
+    def test_list_jobs(self):
+        metadata = {
+            "b": {"creation_timestamp": 2},
+            "a": {"creation_timestamp": 3},
+        }
+
+        def read_metadata(path):
+            return metadata[os.path.basename(path)]
+
+        jobs = cstar.cleanup.list_jobs(listdir=lambda x: ["c", "a", "b"], read_metadata=read_metadata)
+        self.assertEqual(jobs, [("b", metadata["b"]), ("a", metadata["a"]), ("c", None)])
@@ -0,0 +1,100 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from cstar.connectionpool import ConnectionPool
+from cstar.exceptions import BadSSHHost
+from cstar.topology import Host
+from tests.fakes import FakeClock
+
+
+class FakeConnection(object):
+    def __init__(self, host):
+        self.host = host
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def test_reuses_connections(self):
+        pool = ConnectionPool(FakeConnection)
+        with pool.lease("1.2.3.4") as first:
+            pass
+        with pool.lease(Host("a", "1.2.3.4", "eu", "cluster1", "rac1", True, "host1")) as second:
+            pass
+        self.assertIs(first, second)
+        self.assertFalse(first.closed)
+        self.assertEqual(len(pool), 1)
+
+    def test_evicts_idle_connections(self):
+        clock = FakeClock()
+        pool = ConnectionPool(FakeConnection, idle_timeout=10, clock=clock)
+        with pool.lease("1.2.3.4") as first:
+            clock.now = 100
+        with pool.lease("1.2.3.5"):
+            pass
+        self.assertFalse(first.closed)
+        clock.now = 111
+        with pool.lease("1.2.3.5"):
+            pass
+        self.assertTrue(first.closed)
+        self.assertEqual(len(pool), 1)
+
+    def test_max_size_keeps_leased_connections(self):
+        pool = ConnectionPool(FakeConnection, max_size=1)
+        with pool.lease("1.2.3.4") as first:
+            with pool.lease("1.2.3.5") as second:
+                self.assertFalse(first.closed)
+                self.assertFalse(second.closed)
+                self.assertEqual(len(pool), 2)
+            self.assertFalse(first.closed)
+        self.assertEqual(len(pool), 1)
+
+    def test_failure_closes_connection(self):
+        pool = ConnectionPool(FakeConnection)
+        with self.assertRaises(BadSSHHost):
+            with pool.lease("1.2.3.4") as conn:
+                raise BadSSHHost("reset")
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.failures("1.2.3.4"), 1)
+
+    def test_failure_keeps_connection_open_for_other_leases(self):
+        pool = ConnectionPool(FakeConnection)
+        with pool.lease("1.2.3.4") as shared:
+            with self.assertRaises(BadSSHHost):
+                with pool.lease("1.2.3.4") as conn:
+                    self.assertIs(conn, shared)
+                    raise BadSSHHost("reset")
+            self.assertFalse(shared.closed)
+            with pool.lease("1.2.3.4") as fresh:
+                self.assertIsNot(fresh, shared)
+        self.assertTrue(shared.closed)
+        self.assertFalse(fresh.closed)
+        self.assertEqual(len(pool), 1)
+
+    def test_close(self):
+        pool = ConnectionPool(FakeConnection)
+        with pool.lease("1.2.3.4") as conn:
+            pass
+        pool.close()
+        self.assertTrue(conn.closed)
+        self.assertEqual(len(pool), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -31,6 +31,10 @@ def execute_continue(args):
 def execute_cleanup(args):
     return
 
+# noop stub
+def execute_list_jobs(args):
+    return
+
 class CstarcliTest(unittest.TestCase):
 
     DEFAULT_RUN_NAMESPACE_VALUES = {
@@ -95,6 +99,18 @@ class CstarcliTest(unittest.TestCase):
         self.assertEqual(namespace.sub_command, 'cleanup-jobs')
         self.assertEqual(namespace.verbose, 0)
 
+    def test_list_jobs(self):
+
+        parser = argparse.ArgumentParser(prog='cstar', formatter_class=argparse.RawDescriptionHelpFormatter)
+        cstar.args.add_cstar_arguments(parser, cstar.cstarcli.get_commands(), execute_command, execute_continue, execute_cleanup,
+                                       execute_list_jobs)
+        namespace = parser.parse_args(["list-jobs"])
+
+        self.assertEqual(namespace.sub_command, 'list-jobs')
+        self.assertEqual(namespace.verbose, 0)
+        with self.assertRaises(SystemExit):
+            parser.parse_args(["list-jobs", "--stop-after", "3"])
+
     def test_run(self):
 
         parser = argparse.ArgumentParser(prog='cstar', formatter_class=argparse.RawDescriptionHelpFormatter)
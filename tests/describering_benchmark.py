@@ -0,0 +1,61 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure describering parse throughput on synthetic vnode cluster output.
+
+Run with: python -m tests.describering_benchmark [nodes] [vnodes] [rf]
+"""
+
+import random
+import sys
+import time
+
+import cstar.endpoint_mapping
+import cstar.nodetoolparser
+
+
+def make_describering(nodes, vnodes, rf):
+    rnd = random.Random(0)
+    ips = ["10.%d.%d.%d" % (i // 65536, (i // 256) % 256, i % 256) for i in range(nodes)]
+    tokens = sorted(rnd.randint(-2 ** 63, 2 ** 63 - 1) for _ in range(nodes * vnodes))
+    lines = ["Schema Version:abc123-abcd-1234-1234-123456789abc", "TokenRange: "]
+    for i, end_token in enumerate(tokens):
+        start_token = tokens[i - 1]
+        first = rnd.randrange(nodes)
+        endpoints = [ips[(first + j) % nodes] for j in range(rf)]
+        details = ", ".join("EndpointDetails(host:%s, datacenter:dc1, rack:r%d)" % (ip, j) for j, ip in enumerate(endpoints))
+        lines.append("\tTokenRange(start_token:%d, end_token:%d, endpoints:[%s], rpc_endpoints:[%s], endpoint_details:[%s])" %
+                     (start_token, end_token, ", ".join(endpoints), ", ".join(endpoints), details))
+    return "\n".join(lines) + "\n"
+
+
+def main(nodes=300, vnodes=256, rf=3):
+    text = make_describering(nodes, vnodes, rf)
+    mb = len(text) / 1e6
+
+    start = time.perf_counter()
+    ranges = cstar.nodetoolparser.convert_describering_to_range_mapping(
+        cstar.nodetoolparser.parse_nodetool_describering(text))
+    elapsed = time.perf_counter() - start
+    print("AST: parsed %d token ranges (%.1f MB) in %.2f s: %.0f ranges/s, %.1f MB/s" %
+          (len(ranges), mb, elapsed, len(ranges) / elapsed, mb / elapsed))
+
+    start = time.perf_counter()
+    addresses, _ = cstar.endpoint_mapping._adjacency(cstar.nodetoolparser.parse_describering_endpoints(text))
+    elapsed = time.perf_counter() - start
+    print("Streaming: mapped %d hosts (%.1f MB) in %.2f s: %.1f MB/s" % (len(addresses), mb, elapsed, mb / elapsed))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
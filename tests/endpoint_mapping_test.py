@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import cstar.endpoint_mapping
+from cstar.topology import Host, Topology
 
 import json
 import socket
@@ -45,23 +46,27 @@ SMALL_EXAMPLE = """
 """
 
 
+def make_topology(names, lookup=lambda name: name):
+    return Topology(Host(name, lookup(name), "dc1", "cluster1", "r1", True, name) for name in names)
+
+
+def names(mapping):
+    return dict((host.fqdn, set(friend.fqdn for friend in friends)) for host, friends in mapping.items())
+
+
 class TopologyTest(unittest.TestCase):
 
     def ip_lookup(self, name):
         return name
 
     def test_lookup(self):
-        parsed = cstar.endpoint_mapping._parse_range_mapping(json.loads(SMALL_EXAMPLE))
-
-        def lookup(x):
-            return x.upper()
-
-        transformed = cstar.endpoint_mapping._dns_map(parsed, lookup)
-        self.assertEqual(transformed["A"], set(("F", "G", "B", "C")))
+        topology = make_topology("abcdefg", str.upper)
+        mapping = cstar.endpoint_mapping.parse(json.loads(SMALL_EXAMPLE), topology, str.upper)
+        self.assertEqual(names(mapping)["a"], set(("f", "g", "b", "c")))
 
     def test_bigly(self):
         with open("tests/resources/topology.json", 'r') as f:
-            parsed = cstar.endpoint_mapping._parse_range_mapping(json.load(f))
+            addresses, neighbours = cstar.endpoint_mapping._adjacency(range["endpoints"] for range in json.load(f))
         expected = {'cassandra-node-a6233.example.com', 'cassandra-node-a-cdr6.example.com',
                     'cassandra-node-a-rzmz.example.com', 'cassandra-node-a4992.example.com',
                     'cassandra-node-a-7q9q.example.com', 'cassandra-node-a2772.example.com',
@@ -70,14 +75,37 @@ class TopologyTest(unittest.TestCase):
                     'cassandra-node-a6906.example.com', 'cassandra-node-a-r3r4.example.com',
                     'cassandra-node-a-mqvb.example.com', 'cassandra-node-a3577.example.com'}
 
-        self.assertEqual(parsed["cassandra-node-a-qz36.example.com"], expected)
+        host = addresses.index("cassandra-node-a-qz36.example.com")
+        self.assertEqual(set(addresses[i] for i in neighbours[host]), expected)
 
     def test_small(self):
-        parsed = cstar.endpoint_mapping._parse_range_mapping(json.loads(SMALL_EXAMPLE))
-        self.assertEqual(parsed["a"], set(("f", "g", "b", "c")))
+        mapping = names(cstar.endpoint_mapping.parse(json.loads(SMALL_EXAMPLE), make_topology("abcdefg"),
+                                                     self.ip_lookup))
+        self.assertEqual(mapping["a"], set(("f", "g", "b", "c")))
+
+        for host in mapping:
+            self.assertEqual(len(mapping[host]), 4)
+
+    def test_parse_endpoints(self):
+        endpoints = [tuple(range["endpoints"]) for range in json.loads(SMALL_EXAMPLE)]
+        mapping = cstar.endpoint_mapping.parse_endpoints(iter(endpoints + endpoints[::-1]), make_topology("abcdefg"),
+                                                         self.ip_lookup)
+        self.assertEqual(names(mapping), {
+            "a": set("fgbc"), "b": set("gacd"), "c": set("abde"), "d": set("bcef"),
+            "e": set("cdfg"), "f": set("dega"), "g": set("efab")})
+
+    def test_parse_endpoints_resolves_each_address_once(self):
+        endpoints = [tuple(range["endpoints"]) for range in json.loads(SMALL_EXAMPLE)] * 100
+        topology = Topology(Host(name, name.upper(), "dc1", "cluster1", "r1", True, name) for name in "abcdefg")
+        lookups = []
+
+        def lookup(x):
+            lookups.append(x)
+            return x.upper()
 
-        for host in parsed:
-            self.assertEqual(len(parsed[host]), 4)
+        mapping = cstar.endpoint_mapping.parse_endpoints(endpoints, topology, lookup)
+        self.assertEqual(sorted(lookups), list("abcdefg"))
+        self.assertEqual(set(host.fqdn for host in mapping[topology.get_host("A")]), set("fgbc"))
 
     def test_merge_with_overlap(self):
         tree1 = {"a": set("b"), "b": set("c"), "c": set("a")}
@@ -0,0 +1,42 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from cstar.executionresult import OutputTail
+
+
+class OutputTailTest(unittest.TestCase):
+
+    def test_keeps_everything_below_limit(self):
+        tail = OutputTail(10)
+        tail.append(b"abc")
+        tail.append(b"")
+        tail.append(b"def")
+        self.assertEqual(b"abcdef", tail.getvalue())
+        self.assertFalse(tail.truncated)
+
+    def test_keeps_last_bytes(self):
+        tail = OutputTail(5)
+        tail.append(b"abc")
+        tail.append(b"defg")
+        self.assertEqual(b"cdefg", tail.getvalue())
+        self.assertTrue(tail.truncated)
+        tail.append(b"0123456789")
+        self.assertEqual(b"56789", tail.getvalue())
+        self.assertEqual(5, tail.size)
+
+
+if __name__ == '__main__':
+    unittest.main()
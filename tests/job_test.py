@@ -0,0 +1,180 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import io
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+
+import cstar.state
+import cstar.strategy
+from cstar.exceptions import BadSSHHost, HostIsDown
+from cstar.executionresult import ExecutionResult
+from cstar.job import DISCOVERY_WORKERS, Job, one_keyspace_per_replication
+from cstar.topology import Host, Topology
+
+
+def make_cluster(name, prefix, count):
+    return Topology(Host("%s%d" % (name, i), "%s.%d" % (prefix, i), "eu", name, "r1", True, "%s-%d" % (name, i))
+                    for i in range(count))
+
+
+class FakeDiscoveryJob(Job):
+    def __init__(self, clusters, broken=()):
+        super(FakeDiscoveryJob, self).__init__()
+        self.clusters = clusters
+        self.broken = broken
+        self.asked = []
+        self.lock = threading.Lock()
+
+    def _describe_cluster(self, host):
+        with self.lock:
+            self.asked.append(host)
+        if host in self.broken:
+            raise BadSSHHost("Could not establish an SSH connection to host %s" % (host,))
+        for name, topology in self.clusters.items():
+            if host in topology:
+                return name, "schema-" + name, topology, {}
+        return None
+
+
+class LocalConnection(object):
+    """A connection that runs commands on the local host"""
+    hostname = "localhost"
+
+    def run(self, argv):
+        res = subprocess.run(argv, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        return ExecutionResult(argv, res.returncode, res.stdout, res.stderr)
+
+
+class FailingRunner(object):
+    """A job runner that records that it started and fails"""
+    started = []
+
+    def __init__(self, job, host, *args):
+        self.job = job
+        self.host = host
+
+    def __call__(self):
+        FailingRunner.started.append(self.host)
+        self.job.results.put((self.host, ExecutionResult("false", 1, "", "")))
+
+
+class JobTest(unittest.TestCase):
+
+    def test_failure_leaves_queued_hosts_unstarted(self):
+        topology = make_cluster("a", "1.1.1", 6)
+        directory = tempfile.mkdtemp()
+        FailingRunner.started = []
+        try:
+            with Job() as job:
+                job.state = cstar.state.State(topology, cstar.strategy.Strategy.ALL, None, False, False)
+                job.job_runner = FailingRunner
+                job.output_directory = directory
+                job.max_workers = 2
+                job.sleep_on_new_runner = 0
+                job.ssh_lib = "paramiko"
+                job.wait_for_node_to_return = lambda nodes: None
+                job.run()
+            self.assertEqual(2, len(FailingRunner.started))
+            self.assertEqual(set(FailingRunner.started), job.state.progress.failed)
+            self.assertEqual(set(), job.state.progress.running)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_failed_batch_commands_are_reported(self):
+        job = Job()
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            results = job.run_nodetool_batch(LocalConnection(), (("describecluster",), ("status",)), parallel=True)
+        job.close()
+        for res in results:
+            self.assertNotEqual(res.status, 0)
+            self.assertIn("Command %s failed with status %d on host localhost" % (res.command, res.status),
+                          stderr.getvalue())
+
+    def test_get_hosts_topology(self):
+        clusters = {"a": make_cluster("a", "1.1.1", 20), "b": make_cluster("b", "2.2.2", 20)}
+        ips = ["1.1.1.%d" % (i,) for i in range(20)] + ["2.2.2.%d" % (i,) for i in range(20)]
+        with FakeDiscoveryJob(clusters) as job:
+            topology = job.get_hosts_topology(ips)
+            self.assertEqual(40, len(topology))
+            self.assertEqual(["schema-a", "schema-b"], job.schema_versions)
+            self.assertEqual(2, len(job.status_topology_hash))
+
+    def test_get_hosts_topology_only_asks_a_few_hosts_per_cluster(self):
+        clusters = {"a": make_cluster("a", "1.1.1", 20), "b": make_cluster("b", "2.2.2", 20)}
+        ips = ["1.1.1.%d" % (i,) for i in range(20)] + ["2.2.2.%d" % (i,) for i in range(20)]
+        with FakeDiscoveryJob(clusters) as job:
+            job.get_hosts_topology(ips)
+            self.assertLessEqual(len(job.asked), 2 * DISCOVERY_WORKERS)
+
+    def test_get_hosts_topology_fails_for_unknown_host(self):
+        clusters = {"a": make_cluster("a", "1.1.1", 3)}
+        with FakeDiscoveryJob(clusters) as job:
+            self.assertRaises(HostIsDown, job.get_hosts_topology, ["1.1.1.0", "3.3.3.3"])
+
+    def test_get_cluster_topology_skips_broken_seed(self):
+        cluster = make_cluster("a", "1.1.1", 5)
+        with FakeDiscoveryJob({"a": cluster}, broken=("1.1.1.0",)) as job:
+            self.assertEqual(cluster, job.get_cluster_topology(["1.1.1.0", "1.1.1.1"], "a"))
+
+    def test_get_cluster_topology_raises_bad_ssh_host(self):
+        cluster = make_cluster("a", "1.1.1", 5)
+        with FakeDiscoveryJob({"a": cluster}, broken=("1.1.1.0",)) as job:
+            self.assertRaises(BadSSHHost, job.get_cluster_topology, ["1.1.1.0"])
+
+    def test_schema_versions_are_kept_per_cluster(self):
+        clusters = {"a": make_cluster("a", "1.1.1", 3), "b": make_cluster("b", "2.2.2", 3)}
+        with FakeDiscoveryJob(clusters) as job:
+            job.get_cluster_topology(["1.1.1.0"], "a")
+            job.get_cluster_topology(["2.2.2.0"], "b")
+            job.get_cluster_topology(["1.1.1.1"], "a")
+            self.assertEqual(["schema-a", "schema-b"], job.schema_versions)
+
+    def test_saved_endpoint_mapping_is_kept_if_nothing_changed(self):
+        topology = make_cluster("a", "1.1.1", 3)
+        mapping = dict((host, set(topology.hosts) - {host}) for host in topology)
+        with FakeDiscoveryJob({"a": topology}) as job:
+            job.get_endpoint_mapping = lambda topology: self.fail("Endpoint mapping fetched")
+            job.state = cstar.state.State(topology, cstar.strategy.Strategy.TOPOLOGY, mapping, False, False)
+            job.update_current_topology()
+            saved = (job.schema_versions, job.status_topology_hash)
+            job.update_current_topology()
+            job.check_endpoint_mapping(*saved)
+            self.assertIs(job.state.endpoint_mapping, mapping)
+
+    def test_saved_endpoint_mapping_is_replaced_if_schema_changed(self):
+        topology = make_cluster("a", "1.1.1", 3)
+        with FakeDiscoveryJob({"a": topology}) as job:
+            job.get_endpoint_mapping = lambda topology: {}
+            job.state = cstar.state.State(topology, cstar.strategy.Strategy.TOPOLOGY, None, False, False)
+            job.update_current_topology()
+            job.check_endpoint_mapping(["old-schema"], job.status_topology_hash)
+            self.assertEqual(job.state.endpoint_mapping, {})
+
+    def test_one_keyspace_per_replication(self):
+        replication = {"users": "NetworkTopologyStrategy {dc1=3, dc2=2}",
+                       "playlists": "NetworkTopologyStrategy {dc1=3, dc2=2}",
+                       "search": "NetworkTopologyStrategy {dc1=1}"}
+        self.assertEqual(["playlists", "search", "unknown"],
+                         one_keyspace_per_replication(["playlists", "search", "unknown", "users"], replication))
+        self.assertEqual(["a", "b"], one_keyspace_per_replication(["a", "b"], {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
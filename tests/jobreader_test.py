@@ -146,7 +146,7 @@ def get_example_file():
     "hosts_variables": null
 }
 """
-    return revise(SMALL_EXAMPLE, version=cstar.jobwriter.FILE_FORMAT_VERSION)
+    return revise(SMALL_EXAMPLE, version=9)
 
 
 class JobReaderTest(unittest.TestCase):
@@ -214,6 +214,28 @@ class JobReaderTest(unittest.TestCase):
                                endpoint_mapper=lambda x: {}, retry=True)
             self.assertEqual(len(job.state.progress.failed), 0)
 
+    def test_version_8_job(self):
+        job = cstar.job.Job()
+        revised = revise(get_example_file(), version=8)
+        cstar.jobreader._parse(revised, "foo", "/somewhere", job, "1234", 5, 999999, endpoint_mapper=lambda x: {})
+        self.assertEqual(len(job.state.progress.done), 2)
+
+    def test_replay_journal(self):
+        job = cstar.job.Job()
+        revised = revise(get_example_file(), journal_seq=3)
+        journal = [
+            '{"seq": 3, "host": "1.2.3.6", "transition": "failed"}\n',
+            '{"seq": 5, "host": "1.2.3.6", "transition": "done"}\n',
+            '{"seq": 4, "host": "1.2.3.6", "transition": "running"}\n',
+            '{"seq": 6, "host": "1.2.3.',
+        ]
+        cstar.jobreader._parse(revised, "foo", "/somewhere", job, "1234", 5, 999999, endpoint_mapper=lambda x: {},
+                               journal=journal)
+        self.assertEqual(set(host.ip for host in job.state.progress.done), {"1.2.3.4", "1.2.3.5", "1.2.3.6"})
+        self.assertEqual(job.state.progress.running, set())
+        self.assertEqual(job.state.progress.failed, set())
+        self.assertEqual(job._writer.seq, 5)
+
 
 if __name__ == '__main__':
     unittest.main()
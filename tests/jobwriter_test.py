@@ -0,0 +1,198 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import cstar.job
+import cstar.jobreader
+import cstar.jobrunner
+import cstar.jobwriter
+import cstar.progress
+import cstar.state
+import cstar.strategy
+from cstar.topology import Host, Topology
+
+
+def make_job(directory):
+    hosts = [Host("host%d" % i, "1.2.3.%d" % i, "dc", "cluster", "rack", True, "id%d" % i) for i in range(3)]
+    topology = Topology(hosts)
+    job = cstar.job.Job()
+    job.command = "command.sh"
+    job.timeout = None
+    job.env = {}
+    job.job_runner = cstar.jobrunner.RemoteJobRunner
+    job.output_directory = directory
+    job.sleep_on_new_runner = 0
+    job.ssh_lib = "paramiko"
+    job.sudo_args = ""
+    job.addl_jmx_args = None
+    job.state = cstar.state.State(topology, cstar.strategy.Strategy.ALL, None, False, False, max_concurrency=1,
+                                  progress=cstar.progress.Progress())
+    return job, hosts
+
+
+def read(job_id, directory):
+    job = cstar.job.Job()
+    cstar.jobreader.read(job, job_id, None, output_directory=directory, max_days=1, endpoint_mapper=lambda x: {})
+    return job
+
+
+class JobWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def lines(self, name):
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return f.readlines()
+
+    def test_transitions_are_appended_to_the_journal(self):
+        job, hosts = make_job(self.directory)
+        cstar.jobwriter.write(job)
+        cstar.jobwriter.append(job, hosts[0], cstar.jobwriter.RUNNING)
+        cstar.jobwriter.append(job, hosts[0], cstar.jobwriter.DONE)
+        cstar.jobwriter.append(job, hosts[1], cstar.jobwriter.RUNNING)
+        cstar.jobwriter.close(job)
+        self.assertEqual(len(self.lines(cstar.jobwriter.JOURNAL_FILE)), 3)
+
+        resumed = read("1234", self.directory)
+        self.assertEqual(resumed.state.progress.done, {hosts[0]})
+        self.assertEqual(resumed.state.progress.running, {hosts[1]})
+        self.assertEqual(resumed._writer.seq, 3)
+
+    def test_write_starts_a_new_generation(self):
+        job, hosts = make_job(self.directory)
+        cstar.jobwriter.write(job)
+        cstar.jobwriter.sync(job)
+        cstar.jobwriter.append(job, hosts[0], cstar.jobwriter.RUNNING)
+        job.state = job.state.with_running(hosts[0])
+        cstar.jobwriter.write(job)
+        cstar.jobwriter.sync(job)
+        self.assertEqual(self.lines(cstar.jobwriter.JOURNAL_FILE), [])
+        self.assertEqual(len(self.lines(cstar.jobwriter.PREVIOUS_JOURNAL_FILE)), 1)
+        self.assertTrue(self.lines(cstar.jobwriter.PREVIOUS_JOB_FILE))
+        cstar.jobwriter.close(job)
+
+        resumed = read("1234", self.directory)
+        self.assertEqual(resumed.state.progress.running, {hosts[0]})
+        # New records continue the sequence of the job file
+        cstar.jobwriter.append(resumed, hosts[0], cstar.jobwriter.DONE)
+        cstar.jobwriter.close(resumed)
+        self.assertIn('"seq": 2', self.lines(cstar.jobwriter.JOURNAL_FILE)[0])
+
+    def test_corrupt_job_file_falls_back_to_previous_generation(self):
+        job, hosts = make_job(self.directory)
+        cstar.jobwriter.write(job)
+        cstar.jobwriter.sync(job)
+        cstar.jobwriter.append(job, hosts[0], cstar.jobwriter.RUNNING)
+        job.state = job.state.with_running(hosts[0])
+        cstar.jobwriter.write(job)
+        cstar.jobwriter.append(job, hosts[0], cstar.jobwriter.DONE)
+        cstar.jobwriter.close(job)
+        with open(os.path.join(self.directory, cstar.jobwriter.JOB_FILE), 'w') as f:
+            f.write('{"command": ')
+
+        resumed = read("1234", self.directory)
+        self.assertEqual(resumed.state.progress.done, {hosts[0]})
+        self.assertEqual(resumed.state.progress.running, set())
+
+    def test_writes_are_coalesced(self):
+        job, hosts = make_job(self.directory)
+        job._writer = cstar.jobwriter.JobWriter(self.directory, interval=60)
+        with patch("cstar.jobwriter.JobWriter._write_snapshot") as write_snapshot:
+            cstar.jobwriter.write(job)
+            for host in hosts:
+                job.state = job.state.with_running(host)
+                cstar.jobwriter.append(job, host, cstar.jobwriter.RUNNING)
+                cstar.jobwriter.write(job)
+            cstar.jobwriter.close(job)
+        # The first snapshot may be written on its own, the others are queued while the writer waits
+        self.assertLessEqual(write_snapshot.call_count, 2)
+        self.assertEqual(write_snapshot.call_args[0][0]["journal_seq"], 3)
+
+    def test_hosts_are_written_once(self):
+        job, hosts = make_job(self.directory)
+        down = hosts[2]._replace(is_up=False)
+        job.state = job.state.with_topology(Topology(hosts[:2] + [down])).with_running(hosts[0])
+        cstar.jobwriter.write(job)
+        cstar.jobwriter.close(job)
+        with open(os.path.join(self.directory, cstar.jobwriter.JOB_FILE)) as f:
+            state = json.load(f)["state"]
+        self.assertEqual(len(state["hosts"]), 4)
+        self.assertEqual(sorted(state["original_topology"]), [0, 1, 2])
+        self.assertEqual([state["hosts"][i][1] for i in state["progress"]["running"]], [hosts[0].ip])
+
+        resumed = read("1234", self.directory)
+        self.assertEqual(resumed.state.progress.running, {hosts[0]})
+        self.assertEqual([host.is_up for host in resumed.state.original_topology], [True, True, True])
+        self.assertEqual(resumed.state.current_topology.get_down(), Topology([down]))
+
+    def test_metadata(self):
+        job, hosts = make_job(self.directory)
+        job.state = job.state.with_running(hosts[0]).with_done(hosts[0]).with_running(hosts[1])
+        cstar.jobwriter.write(job)
+        cstar.jobwriter.close(job)
+        metadata = cstar.jobreader.read_metadata(self.directory)
+        self.assertEqual(metadata["job_id"], os.path.basename(self.directory))
+        self.assertEqual(metadata["command"], "command.sh")
+        self.assertEqual(metadata["status"], cstar.jobwriter.UNFINISHED)
+        self.assertEqual((metadata["hosts"], metadata["done"], metadata["running"], metadata["failed"]), (3, 1, 1, 0))
+
+    def test_endpoint_mapping_is_saved(self):
+        job, hosts = make_job(self.directory)
+        mapping = dict((host, set(hosts) - {host}) for host in hosts)
+        job.state = cstar.state.State(job.state.original_topology, cstar.strategy.Strategy.TOPOLOGY, mapping, False,
+                                      False)
+        job.schema_versions = ["schema"]
+        job.status_topology_hash = ["hash"]
+        cstar.jobwriter.write(job)
+        cstar.jobwriter.close(job)
+
+        resumed = cstar.job.Job()
+        cstar.jobreader.read(resumed, "1234", None, output_directory=self.directory, max_days=1,
+                             endpoint_mapper=lambda x: self.fail("Endpoint mapping fetched"))
+        self.assertEqual(resumed.state.endpoint_mapping, mapping)
+        self.assertEqual(resumed.schema_versions, ["schema"])
+        self.assertEqual(resumed.status_topology_hash, ["hash"])
+
+    def test_journal_is_compacted(self):
+        job, hosts = make_job(self.directory)
+        with patch("cstar.jobwriter.JOURNAL_COMPACT_RECORDS", 2):
+            job.state = job.state.with_running(hosts[0])
+            cstar.jobwriter.append(job, hosts[0], cstar.jobwriter.RUNNING)
+            job.state = job.state.with_done(hosts[0])
+            cstar.jobwriter.append(job, hosts[0], cstar.jobwriter.DONE)
+            cstar.jobwriter.sync(job)
+            self.assertEqual(self.lines(cstar.jobwriter.JOURNAL_FILE), [])
+            job.state = job.state.with_running(hosts[1])
+            cstar.jobwriter.append(job, hosts[1], cstar.jobwriter.RUNNING)
+        cstar.jobwriter.close(job)
+
+        resumed = read("1234", self.directory)
+        self.assertEqual(resumed.state.progress.done, {hosts[0]})
+        self.assertEqual(resumed.state.progress.running, {hosts[1]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -51,11 +51,42 @@ class NodetoolParserTest(unittest.TestCase):
             self.assertEqual(name, "c3111")
             self.assertEqual(schema_version, "d8210030-20a4-3f05-b2ef-ea154a6d8ef6")
 
+    def test_parse_keyspace_replication(self):
+        with open("tests/resources/describecluster-4.0.txt", 'r') as f:
+            nodetool_output = f.read()
+            (name, schema_version) = cstar.nodetoolparser.parse_describe_cluster(nodetool_output)
+            self.assertEqual(name, "c40")
+            self.assertEqual(schema_version, "2207c2a9-f598-3971-986b-2926e09e239d")
+            replication = cstar.nodetoolparser.parse_keyspace_replication(nodetool_output)
+            self.assertEqual(8, len(replication))
+            self.assertEqual("NetworkTopologyStrategy {dc1=3, dc2=2}", replication["users"])
+            self.assertEqual(replication["users"], replication["playlists"])
+            self.assertEqual("LocalStrategy {}", replication["system"])
+        with open("tests/resources/describecluster-3.11.txt", 'r') as f:
+            self.assertEqual({}, cstar.nodetoolparser.parse_keyspace_replication(f.read()))
+
     def test_tokenize(self):
         with open("tests/resources/describering-2.2.txt", 'r') as f:
             tokens = cstar.nodetoolparser.describering._tokenize(f.read())
             self.assertEqual(243, len(tokens))
 
+    def test_tokenize_values(self):
+        tokens = cstar.nodetoolparser.describering._tokenize(
+            "TokenRange(start_token:-12, endpoints:[2001:db8:0:0:0:0:0:1, node-1.example.com], rack:r1)")
+        self.assertEqual(["TokenRange", "(", "start_token", ":", -12, ",", "endpoints", ":", "[",
+                          "2001:db8:0:0:0:0:0:1", ",", "node-1.example.com", "]", ",", "rack", ":", "r1", ")"],
+                         [token.val for token in tokens])
+        self.assertEqual(39, tokens[9].offset)
+        self.assertRaises(cstar.exceptions.ParseException, cstar.nodetoolparser.describering._tokenize, "foo(bar: !)")
+
+    def test_parse_describering_endpoints(self):
+        with open("tests/resources/describering-ipv6-3.11.txt", 'r') as f:
+            text = f.read()
+        endpoints = list(cstar.nodetoolparser.parse_describering_endpoints(text))
+        range_mapping = cstar.nodetoolparser.convert_describering_to_range_mapping(
+            cstar.nodetoolparser.parse_nodetool_describering(text))
+        self.assertEqual([tuple(r["endpoints"]) for r in range_mapping], endpoints)
+
     def test_parse_describering(self):
         with open("tests/resources/describering-2.0.txt", 'r') as f:
             ast = cstar.nodetoolparser.parse_nodetool_describering(f.read())
@@ -163,6 +194,32 @@ class NodetoolParserTest(unittest.TestCase):
             self.assertEqual("a6234243-8abd-435e-b822-838bc4749160", topology.get_host("11.111.111.111").host_id)
             self.assertEqual("rac2", topology.get_host("11.111.111.112").rack)
             self.assertEqual("97123467-7dab-4a9e-bd44-5613ac419961", topology.get_host("11.111.111.119").host_id)
+
+    def test_parse_nodetool_status_resolve_hostnames(self):
+        with open("tests/resources/status-2.2.txt", 'r') as f:
+            topology = cstar.nodetoolparser.parse_nodetool_status(
+                f.read(), 'test_cluster', lambda ips: {"11.111.111.111": "node1.example.com"}, True)
+            self.assertEqual("node1.example.com", topology.get_host("11.111.111.111").fqdn)
+            self.assertEqual("11.111.111.112", topology.get_host("11.111.111.112").fqdn)
+
+    def test_split_batch_output(self):
+        commands = [("nodetool", "describecluster"), ("nodetool", "status"), ("nodetool", "describering", "ks")]
+        out = ("D begin 0\nName: foo\n\nD end 0 0\n"
+               "D begin 1\n\nD end 1 1\n")
+        err = ("D begin 0\n\nD end 0\n"
+               "D begin 1\nerror: connection refused\n\nD end 1\n")
+        results = cstar.nodetoolparser.split_batch_output(out, err, "D", commands)
+        self.assertEqual(3, len(results))
+        self.assertEqual((0, "Name: foo\n", ""), (results[0].status, results[0].out, results[0].err))
+        self.assertEqual((1, "", "error: connection refused\n"), (results[1].status, results[1].out, results[1].err))
+        self.assertEqual(-1, results[2].status)
+        self.assertEqual("nodetool describering ks", results[2].command)
+
+    def test_make_batch_script(self):
+        script = cstar.nodetoolparser.make_batch_script([("nodetool", "describering", "it's")], "D")
+        self.assertIn("nodetool describering 'it'\"'\"'s'; s=$?", script)
+        parallel = cstar.nodetoolparser.make_batch_script([("nodetool", "status")], "D", parallel=True)
+        self.assertIn("wait", parallel)
             
 
 
@@ -0,0 +1,89 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+
+from pkg_resources import resource_string
+
+from cstar.remote_paramiko import _finished_status
+
+
+@unittest.skipUnless(shutil.which("sh"), "needs a Bourne shell")
+class RemoteJobTest(unittest.TestCase):
+    """Run remote_job.sh locally, in the same way run_job runs it on a host"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        wrapper = resource_string('cstar.resources', 'scripts/remote_job.sh').decode("utf-8") % ("GREETING=hi",)
+        self.write("wrapper", wrapper)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            f.write(text)
+        os.chmod(path, 0o755)
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name)) as f:
+            return f.read()
+
+    def start_wrapper(self):
+        return subprocess.Popen(["./wrapper"], cwd=self.directory, stdout=subprocess.PIPE)
+
+    def run_wrapper(self):
+        return subprocess.run(["./wrapper"], cwd=self.directory, stdout=subprocess.PIPE, timeout=30).stdout
+
+    def test_status_is_written_and_reported(self):
+        self.write("job", "#!/bin/sh\necho $GREETING\necho oops >&2\nexit 3\n")
+        output = self.run_wrapper()
+        self.assertEqual(_finished_status(output), 3)
+        self.assertEqual(self.read("status"), "3\n")
+        self.assertEqual(self.read("stdout"), "hi\n")
+        self.assertEqual(self.read("stderr"), "oops\n")
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "status.tmp")))
+
+    def test_finished_job_is_reported_again(self):
+        self.write("job", "#!/bin/sh\nexit 0\n")
+        self.run_wrapper()
+        self.assertEqual(_finished_status(self.run_wrapper()), 0)
+
+    def test_resumed_wrapper_waits_for_the_running_job(self):
+        self.write("job", "#!/bin/sh\nwhile ! test -f go; do sleep 0.1; done\nexit 5\n")
+        first = self.start_wrapper()
+        try:
+            while not os.path.exists(os.path.join(self.directory, "pid")):
+                self.assertIsNone(first.poll())
+                time.sleep(0.01)
+            second = self.start_wrapper()
+            time.sleep(0.2)
+            self.assertIsNone(second.poll())
+            open(os.path.join(self.directory, "go"), "w").close()
+            output, _ = second.communicate(timeout=30)
+            self.assertEqual(_finished_status(output), 5)
+            self.assertEqual(self.read("status"), "5\n")
+        finally:
+            first.communicate(timeout=30)
+        self.assertEqual(first.returncode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,332 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from paramiko.ssh_exception import ChannelException, SSHException
+
+from cstar.remote_paramiko import RemoteParamiko, _finished_status
+
+
+class FakeBuffer(object):
+    def __init__(self):
+        self.data = b""
+        self.event = None
+
+    def set_event(self, event):
+        self.event = event
+
+    def feed(self, data):
+        self.data += data
+        self.event.set()
+
+    def read(self, size):
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class FakeChannel(object):
+    """A channel that gets its data from a script of steps, run one by one as the reader polls it. Like paramiko's
+    transport thread, a step can feed data and EOF at any point, including between the reader's checks."""
+
+    def __init__(self, status=0):
+        self.in_buffer = FakeBuffer()
+        self.in_stderr_buffer = FakeBuffer()
+        self.steps = []
+        self.status = status
+        self.eof_received = False
+        self.closed = False
+
+    def _step(self):
+        if self.steps:
+            self.steps.pop(0)(self)
+
+    def feed(self, out=b"", err=b"", eof=False):
+        def step(channel):
+            if out:
+                channel.in_buffer.feed(out)
+            if err:
+                channel.in_stderr_buffer.feed(err)
+            if eof:
+                channel.eof_received = True
+                channel.in_buffer.event.set()
+        return step
+
+    def recv_ready(self):
+        self._step()
+        return len(self.in_buffer) > 0
+
+    def recv_stderr_ready(self):
+        self._step()
+        return len(self.in_stderr_buffer) > 0
+
+    def recv(self, size):
+        return self.in_buffer.read(size)
+
+    def recv_stderr(self, size):
+        return self.in_stderr_buffer.read(size)
+
+    def shutdown_write(self):
+        pass
+
+    def recv_exit_status(self):
+        return self.status
+
+    def close(self):
+        self.closed = True
+
+
+class FakeFile(object):
+    def __init__(self, channel):
+        self.channel = channel
+
+    def close(self):
+        pass
+
+
+def read_results(channel):
+    files = (FakeFile(channel), FakeFile(channel), FakeFile(channel))
+    status, out, err = RemoteParamiko("host")._read_results(*files)
+    return status, b"".join(out), b"".join(err)
+
+
+class ReadResultsTest(unittest.TestCase):
+
+    def test_reads_until_eof(self):
+        channel = FakeChannel(status=3)
+        channel.steps = [channel.feed(out=b"a"), channel.feed(err=b"b"), channel.feed(out=b"c", eof=True)]
+        self.assertEqual(read_results(channel), (3, b"ac", b"b"))
+
+    def test_last_chunk_arriving_with_eof_is_not_lost(self):
+        channel = FakeChannel()
+        # Nothing is ready when stdout is checked, then the last chunk and EOF arrive before stderr is checked
+        channel.steps = [lambda c: None, channel.feed(out=b"last chunk", eof=True)]
+        self.assertEqual(read_results(channel), (0, b"last chunk", b""))
+
+    def test_eof_without_output(self):
+        channel = FakeChannel()
+        channel.steps = [channel.feed(eof=True)]
+        self.assertEqual(read_results(channel), (0, b"", b""))
+
+
+class FinishedStatusTest(unittest.TestCase):
+
+    def test_status_is_taken_from_the_marker(self):
+        self.assertEqual(_finished_status(b"nohup: ignoring input\ncstar-job-finished 3\n"), 3)
+        self.assertEqual(_finished_status(b"cstar-job-finished -1"), -1)
+
+    def test_missing_marker(self):
+        self.assertIsNone(_finished_status(b""))
+        self.assertIsNone(_finished_status(b"cstar-job-finished \n"))
+        self.assertIsNone(_finished_status(b"not cstar-job-finished 0\n"))
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.closed = False
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.closed = True
+        self.transport.active = False
+
+
+class RetryOnResetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.remote = RemoteParamiko("host")
+        self.remote.client = FakeClient()
+
+        def connect():
+            if not self.remote.client:
+                self.remote.client = FakeClient()
+            return self.remote.client
+        self.remote._connect = connect
+        self.clients = []
+
+    def open_channel(self, errors):
+        def open_channel(client):
+            self.clients.append(client)
+            if errors:
+                raise errors.pop(0)
+            return "channel"
+        return open_channel
+
+    @patch("cstar.remote_paramiko._CHANNEL_RETRY_DELAY", 0)
+    def test_refused_channel_is_retried_on_the_same_connection(self):
+        first = self.remote.client
+        result = self.remote._retry_on_reset(self.open_channel([ChannelException(1, "refused")]))
+        self.assertEqual(result, "channel")
+        self.assertEqual(self.clients, [first, first])
+        self.assertFalse(first.closed)
+        self.assertIs(self.remote.client, first)
+
+    def test_reset_connection_is_reopened(self):
+        first = self.remote.client
+        first.transport.active = False
+        result = self.remote._retry_on_reset(self.open_channel([SSHException("reset")]))
+        self.assertEqual(result, "channel")
+        self.assertTrue(first.closed)
+        self.assertIsNot(self.remote.client, first)
+        self.assertEqual(self.clients, [first, self.remote.client])
+
+
+class FakeStat(object):
+    def __init__(self, size):
+        self.st_size = size
+
+
+class FakeSFTPFile(object):
+    def __init__(self, data=b""):
+        self.data = data
+        self.requests = []
+        self.mode = None
+        self.pipelined = False
+        self.prefetched = False
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def stat(self):
+        return FakeStat(len(self.data))
+
+    def readv(self, chunks):
+        self.requests.append(chunks)
+        for offset, length in chunks:
+            yield self.data[offset:offset + length]
+
+    def prefetch(self):
+        self.prefetched = True
+
+    def read(self):
+        return self.data
+
+    def set_pipelined(self, pipelined):
+        self.pipelined = pipelined
+
+    def write(self, data):
+        self.data += data.encode("utf-8") if isinstance(data, str) else data
+
+    def chmod(self, mode):
+        self.mode = mode
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSFTPClient(object):
+    def __init__(self, files=None, directories=()):
+        self.files = files or {}
+        self.directories = list(directories)
+        self.created = []
+
+    def file(self, path, mode):
+        return self.files[path]
+
+    def open(self, path, mode):
+        self.files[path] = FakeSFTPFile()
+        return self.files[path]
+
+    def stat(self, path):
+        if path not in self.directories:
+            raise IOError("No such file")
+        return FakeStat(0)
+
+    def mkdir(self, path):
+        if path in self.directories:
+            raise IOError("File exists")
+        self.directories.append(path)
+        self.created.append(path)
+
+
+class StageFilesTest(unittest.TestCase):
+
+    def test_commands_are_written_to_a_new_directory(self):
+        sftp = FakeSFTPClient(directories=[".cstar"])
+        RemoteParamiko._write_commands(sftp, ".cstar/remote-jobs/id", {"job": b"echo hi\n", "wrapper": "#!/bin/sh\n"})
+        self.assertEqual(sftp.created, [".cstar/remote-jobs", ".cstar/remote-jobs/id"])
+        self.assertEqual(sftp.files[".cstar/remote-jobs/id/job"].data, b"echo hi\n")
+        self.assertEqual(sftp.files[".cstar/remote-jobs/id/wrapper"].data, b"#!/bin/sh\n")
+        for f in sftp.files.values():
+            self.assertEqual(f.mode, 0o755)
+            self.assertTrue(f.pipelined)
+            self.assertTrue(f.closed)
+
+    def test_existing_directory_is_reused(self):
+        sftp = FakeSFTPClient(directories=[".cstar/remote-jobs/id"])
+        RemoteParamiko._write_commands(sftp, ".cstar/remote-jobs/id", {"job": b""})
+        self.assertEqual(sftp.created, [])
+        self.assertIn(".cstar/remote-jobs/id/job", sftp.files)
+
+    def test_status_and_output_are_read_back(self):
+        files = {"id/status": FakeSFTPFile(b"3\n"), "id/stdout": FakeSFTPFile(b"out"),
+                 "id/stderr": FakeSFTPFile(b"err")}
+        result = RemoteParamiko._read_files(FakeSFTPClient(files), ("id/status", "id/stdout", "id/stderr"))
+        self.assertEqual(result, ["3\n", "out", "err"])
+        for f in files.values():
+            self.assertTrue(f.prefetched)
+            self.assertTrue(f.closed)
+
+
+class StreamFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @patch("cstar.remote_paramiko.OUTPUT_TAIL_SIZE", 10)
+    @patch("cstar.remote_paramiko._STREAM_CHUNK_SIZE", 4)
+    @patch("cstar.remote_paramiko._STREAM_WINDOW", 3)
+    def test_files_are_streamed_in_bounded_windows(self):
+        out = FakeSFTPFile(b"0123456789" * 5)
+        err = FakeSFTPFile(b"oops")
+        local_out = os.path.join(self.directory, "out")
+        local_err = os.path.join(self.directory, "err")
+        tails = RemoteParamiko._stream_files(FakeSFTPClient({"stdout": out, "stderr": err}),
+                                             (("stdout", local_out), ("stderr", local_err)))
+        with open(local_out, 'rb') as f:
+            self.assertEqual(f.read(), out.data)
+        self.assertTrue(tails[0].endswith("0123456789"))
+        self.assertIn("output truncated", tails[0])
+        self.assertEqual(tails[1], "oops")
+        self.assertTrue(all(len(chunks) <= 3 for chunks in out.requests))
+        self.assertEqual(sum(length for chunks in out.requests for _, length in chunks), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from cstar.resolver import Resolver
+from tests.fakes import FakeClock
+
+
+class FakeDNS(object):
+    def __init__(self, names):
+        self.names = names
+        self.forward_calls = []
+        self.reverse_calls = []
+        self.lock = threading.Lock()
+
+    def gethostbyname(self, name):
+        with self.lock:
+            self.forward_calls.append(name)
+        if name not in self.names:
+            raise socket.gaierror("unknown name %s" % (name,))
+        return self.names[name]
+
+    def gethostbyaddr(self, address):
+        with self.lock:
+            self.reverse_calls.append(address)
+        for name, ip in self.names.items():
+            if ip == address:
+                return name, [], [address]
+        raise socket.herror("no reverse record for %s" % (address,))
+
+
+class ResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dns = FakeDNS({"a.example.com": "1.1.1.1", "b.example.com": "2.2.2.2"})
+        self.clock = FakeClock(1000)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_resolver(self, cache_file=None):
+        return Resolver(cache_file, ttl=100, negative_ttl=10, clock=self.clock,
+                        gethostbyname=self.dns.gethostbyname, gethostbyaddr=self.dns.gethostbyaddr)
+
+    def test_lookup_all_resolves_each_name_once(self):
+        resolver = self.make_resolver()
+        names = ["a.example.com", "b.example.com", "a.example.com"]
+        self.assertEqual({"a.example.com": "1.1.1.1", "b.example.com": "2.2.2.2"}, resolver.lookup_all(names))
+        self.assertEqual("1.1.1.1", resolver.lookup("a.example.com"))
+        self.assertEqual(2, len(self.dns.forward_calls))
+
+    def test_lookup_all_raises_on_unknown_name(self):
+        resolver = self.make_resolver()
+        self.assertRaises(socket.gaierror, resolver.lookup_all, ["a.example.com", "c.example.com"])
+
+    def test_answers_expire(self):
+        resolver = self.make_resolver()
+        resolver.lookup("a.example.com")
+        self.clock.now += 101
+        resolver.lookup("a.example.com")
+        self.assertEqual(2, len(self.dns.forward_calls))
+
+    def test_reverse_lookup_all(self):
+        resolver = self.make_resolver()
+        self.assertEqual({"1.1.1.1": "a.example.com"}, resolver.reverse_lookup_all(["1.1.1.1", "3.3.3.3"]))
+        resolver.reverse_lookup_all(["1.1.1.1", "3.3.3.3"])
+        self.assertEqual(2, len(self.dns.reverse_calls))
+        # Missing reverse records are cached for a shorter time
+        self.clock.now += 11
+        resolver.reverse_lookup_all(["1.1.1.1", "3.3.3.3"])
+        self.assertEqual(["3.3.3.3"], sorted(self.dns.reverse_calls)[2:])
+
+    def test_slow_reverse_lookups_are_waited_for(self):
+        def gethostbyaddr(address):
+            if address == "2.2.2.2":
+                time.sleep(0.2)
+            return self.dns.gethostbyaddr(address)
+        resolver = Resolver(clock=self.clock, gethostbyaddr=gethostbyaddr)
+        self.assertEqual({"1.1.1.1": "a.example.com", "2.2.2.2": "b.example.com"},
+                         resolver.reverse_lookup_all(["1.1.1.1", "2.2.2.2"]))
+
+    def test_cache_is_persisted(self):
+        cache_file = os.path.join(self.directory, "dns.json")
+        resolver = self.make_resolver(cache_file)
+        resolver.lookup_all(["a.example.com"])
+        resolver.reverse_lookup("2.2.2.2")
+        resolver.save()
+
+        resolver = self.make_resolver(cache_file)
+        self.assertEqual("1.1.1.1", resolver.lookup("a.example.com"))
+        self.assertEqual("b.example.com", resolver.reverse_lookup("2.2.2.2"))
+        self.assertEqual(1, len(self.dns.forward_calls))
+        self.assertEqual(1, len(self.dns.reverse_calls))
+
+        self.clock.now += 101
+        resolver = self.make_resolver(cache_file)
+        resolver.lookup("a.example.com")
+        self.assertEqual(2, len(self.dns.forward_calls))
+
+    def test_unreadable_cache_is_ignored(self):
+        cache_file = os.path.join(self.directory, "dns.json")
+        with open(cache_file, "w") as f:
+            f.write("not json")
+        resolver = self.make_resolver(cache_file)
+        self.assertEqual("1.1.1.1", resolver.lookup("a.example.com"))
+
+
+if __name__ == '__main__':
+    unittest.main()
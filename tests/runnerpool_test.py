@@ -0,0 +1,82 @@
+# Copyright 2017 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import unittest
+
+from cstar.runnerpool import RateLimiter, RunnerPool
+from tests.fakes import FakeClock
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_waits_are_spaced_out(self):
+        clock = FakeClock(100.0)
+        limiter = RateLimiter(0.5, clock=clock, sleep=clock.sleep)
+        for _ in range(3):
+            limiter.wait()
+        self.assertEqual(clock.sleeps, [0.5, 1.0])
+
+    def test_no_wait_after_a_pause(self):
+        clock = FakeClock(100.0)
+        limiter = RateLimiter(0.5, clock=clock, sleep=clock.sleep)
+        limiter.wait()
+        clock.now += 10
+        limiter.wait()
+        self.assertEqual(clock.sleeps, [])
+
+    def test_no_interval(self):
+        clock = FakeClock(100.0)
+        limiter = RateLimiter(0, clock=clock, sleep=clock.sleep)
+        limiter.wait()
+        limiter.wait()
+        self.assertEqual(clock.sleeps, [])
+
+
+class RunnerPoolTest(unittest.TestCase):
+    def test_workers_are_bounded(self):
+        pool = RunnerPool(max_workers=2)
+        lock = threading.Lock()
+        release = threading.Event()
+        state = {"active": 0, "max": 0}
+
+        def runner():
+            with lock:
+                state["active"] += 1
+                state["max"] = max(state["max"], state["active"])
+            release.wait(5)
+            with lock:
+                state["active"] -= 1
+
+        futures = [pool.submit(runner) for _ in range(6)]
+        # Submitting does not block, the runners wait in the queue
+        self.assertFalse(all(future.done() for future in futures))
+        release.set()
+        pool.shutdown()
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual(state["max"], 2)
+
+    def test_exceptions_are_kept_in_the_future(self):
+        pool = RunnerPool(max_workers=1)
+
+        def runner():
+            raise ValueError("boom")
+
+        future = pool.submit(runner)
+        pool.shutdown()
+        with self.assertRaises(ValueError):
+            future.result()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,7 +17,7 @@ import unittest
 from cstar.state import State
 from cstar.progress import Progress
 from cstar.topology import Topology, Host
-from cstar.strategy import Strategy, find_next_host, HostIsDown
+from cstar.strategy import Strategy, Scheduler, find_next_host, color_conflict_graph, HostIsDown
 
 
 def make_topology(size, has_down_host=False):
@@ -200,6 +200,83 @@ class StrategyTest(unittest.TestCase):
             state = finish_work(state)
         self.assertEqual(12, laps)
 
+    def test_scheduler_blocks_and_releases_neighbours(self):
+        top = make_topology(size=12)
+        mapping = make_mapping(top)
+        scheduler = Scheduler(Strategy.TOPOLOGY, top, mapping, True, True, None, None, False)
+
+        first = scheduler.next_host()
+        scheduler.mark_running(first)
+        running = [first]
+        while True:
+            h = scheduler.next_host()
+            if not h:
+                break
+            self.assertFalse(any(h in mapping[r] for r in running))
+            scheduler.mark_running(h)
+            running.append(h)
+        self.assertEqual(len(running), 16)
+
+        blocked = next(iter(mapping[first]))
+        for h in running:
+            scheduler.mark_done(h)
+        self.assertFalse(any(h in mapping[blocked] for h in scheduler._running))
+        self.assertIsNotNone(scheduler.next_host())
+
+    def test_one_order(self):
+        top = make_topology(size=6)
+        self.assertEqual(run_waves(State(top, Strategy.ONE, None, True, True)), [
+            ['a0', 'b0', 'c0', 'd0'], ['a3', 'b3', 'c3', 'd3'], ['a1', 'b1', 'c1', 'd1'],
+            ['a4', 'b4', 'c4', 'd4'], ['a2', 'b2', 'c2', 'd2'], ['a5', 'b5', 'c5', 'd5']])
+
+    def test_topology_order(self):
+        top = make_topology(size=6)
+        mapping = make_mapping(top)
+        self.assertEqual(run_waves(State(top, Strategy.TOPOLOGY, mapping, True, True)), [
+            ['a0', 'a3', 'b0', 'b3', 'c0', 'c3', 'd0', 'd3'],
+            ['a1', 'a4', 'b1', 'b4', 'c1', 'c4', 'd1', 'd4'],
+            ['a2', 'a5', 'b2', 'b5', 'c2', 'c5', 'd2', 'd5']])
+        self.assertEqual(run_waves(State(top, Strategy.TOPOLOGY, mapping, False, True)), [
+            ['a0', 'a3', 'b0', 'b3'], ['c0', 'c3', 'd0', 'd3'], ['a1', 'a4', 'b1', 'b4'],
+            ['c1', 'c4', 'd1', 'd4'], ['a2', 'a5', 'b2', 'b5'], ['c2', 'c5', 'd2', 'd5']])
+
+    def test_all_order(self):
+        top = make_topology(size=6)
+        self.assertEqual(run_waves(State(top, Strategy.ALL, None, False, False)), [
+            ['a0', 'a3', 'a1', 'a4', 'a2', 'a5'], ['b0', 'b3', 'b1', 'b4', 'b2', 'b5'],
+            ['c0', 'c3', 'c1', 'c4', 'c2', 'c5'], ['d0', 'd3', 'd1', 'd4', 'd2', 'd5']])
+
+    def test_branched_states_do_not_share_progress(self):
+        top = make_topology(size=2)
+        a0 = top.get_host("1.2.3.0")
+        b0 = top.get_host("2.2.3.0")
+        state = State(top, Strategy.ONE, None, False, True).with_running(a0).with_running(b0)
+        self.assertIsNone(state.find_next_host())
+
+        done_a0 = state.with_done(a0)
+        done_b0 = state.with_done(b0)
+        self.assertEqual(done_a0.find_next_host().fqdn, "a1")
+        self.assertEqual(done_b0.find_next_host().fqdn, "b1")
+        self.assertIsNone(state.find_next_host())
+        self.assertEqual(state.progress.running, {a0, b0})
+
+    def test_color_conflict_graph(self):
+        top = make_topology(size=12)
+        mapping = make_mapping(top)
+        waves = color_conflict_graph(top, mapping)
+        self.assertEqual(set(waves.values()), {0, 1, 2})
+        for host, friends in mapping.items():
+            for friend in friends:
+                self.assertNotEqual(waves[host], waves[friend])
+
+    def test_expected_waves(self):
+        top = make_topology(size=12)
+        mapping = make_mapping(top)
+        self.assertEqual(State(top, Strategy.TOPOLOGY, mapping, True, True).expected_waves(), 3)
+        self.assertEqual(State(top, Strategy.TOPOLOGY, mapping, True, False).expected_waves(), 6)
+        self.assertEqual(State(top, Strategy.TOPOLOGY, mapping, False, False).expected_waves(), 12)
+        self.assertEqual(State(top, Strategy.TOPOLOGY, mapping, True, True, max_concurrency=4).expected_waves(), 12)
+
 
 def add_work(state):
     """Add more nodes to running until no more nodes can be added"""
@@ -211,6 +288,24 @@ def add_work(state):
     return state
 
 
+def run_waves(state):
+    """Run a job to completion, one wave at a time, and return the names of the hosts of each wave in order"""
+    waves = []
+    while True:
+        wave = []
+        while True:
+            h = state.find_next_host()
+            if not h:
+                break
+            wave.append(h.fqdn)
+            state = state.with_running(h)
+        if not wave:
+            return waves
+        waves.append(wave)
+        for h in list(state.progress.running):
+            state = state.with_done(h)
+
+
 def finish_work(state):
     """Move all running nodes to done"""
     state.progress.done = state.progress.done | state.progress.running
@@ -12,7 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from cstar.topology import Topology, Host
+from cstar.topology import Topology, Host, Datacenter
+from cstar.exceptions import UnknownHost
 import json
 
 import unittest
@@ -39,6 +40,28 @@ test_topology_c = Topology((Host("a", IP1, "eu", "cluster1", "rac1", True, 'host
 
 class TopologyTest(unittest.TestCase):
 
+    def test_get_host(self):
+        self.assertEqual(test_topology.get_host(IP3).fqdn, "c")
+        self.assertEqual(test_topology.get_host(Host("c", IP3, "us", "cluster1", "rac1", True, 'host3')).fqdn, "c")
+        with self.assertRaises(UnknownHost):
+            test_topology.get_host("9.9.9.9")
+
+    def test_filters_are_cached(self):
+        self.assertIs(test_topology.with_cluster("cluster1"), test_topology.with_cluster("cluster1"))
+        self.assertIs(test_topology.with_cluster("cluster1").with_dc("cluster1", "us"),
+                      test_topology.with_cluster("cluster1").with_dc("cluster1", "us"))
+        self.assertIs(test_topology.get_up(), test_topology)
+        self.assertEqual(len(test_topology.get_down()), 0)
+
+    def test_with_dc_filter(self):
+        sub = test_topology.with_dc_filter("us")
+        self.assertEqual(len(sub), 3)
+        self.assertEqual(sub.get_clusters(), {"cluster1", "cluster2"})
+
+    def test_without_dcs(self):
+        sub = test_topology.without_dcs({Datacenter("cluster1", "us")})
+        self.assertEqual(set(host.fqdn for host in sub), {"a", "b", "e"})
+
     def test_with_dc(self):
         sub = test_topology.with_dc("cluster1", "us")
         self.assertEqual(len(sub), 2)